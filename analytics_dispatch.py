@@ -0,0 +1,299 @@
+"""
+Uniwersalny Żołnierz - Asynchroniczna wysyłka zdarzeń GA4 (Measurement Protocol)
+Request tylko wrzuca zdarzenie do ograniczonej kolejki - wysyłką partiami zajmuje się wątek w tle
+"""
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from analytics_spool import EventSpool, CircuitBreaker
+
+GA4_DEFAULT_ENDPOINT = 'https://www.google-analytics.com/mp/collect'
+
+# Limit Measurement Protocol: maksymalnie 25 zdarzeń w jednym żądaniu
+GA4_MAX_EVENTS_PER_REQUEST = 25
+
+# Wynik pojedynczego żądania
+SEND_OK = 'ok'
+SEND_RETRY = 'retry'        # błąd sieci, 429, 5xx - zdarzenia wracają do bufora dyskowego
+SEND_REJECTED = 'rejected'  # pozostałe 4xx - ponowna wysyłka nic nie da
+
+
+class GA4Dispatcher:
+    """Kolejka zdarzeń GA4 + wątek wysyłający partie przez wspólną sesję HTTP (pula połączeń)
+
+    spool - opcjonalny bufor dyskowy: zdarzenia, których nie udało się wysłać, trafiają na dysk
+    i są wysyłane ponownie przez wątek replay (backoff wykładniczy + circuit breaker)
+    """
+
+    def __init__(self, measurement_id: str, api_secret: str, endpoint: str = GA4_DEFAULT_ENDPOINT,
+                 queue_size: int = 10000, batch_size: int = GA4_MAX_EVENTS_PER_REQUEST,
+                 flush_interval: float = 0.5, timeout: float = 5.0, spool: Optional[EventSpool] = None,
+                 breaker: Optional[CircuitBreaker] = None, retry_base_delay: float = 1.0,
+                 retry_max_delay: float = 300.0, replay_interval: float = 5.0):
+        self.measurement_id = measurement_id
+        self.api_secret = api_secret
+        self.endpoint = endpoint
+        self.batch_size = max(1, min(batch_size, GA4_MAX_EVENTS_PER_REQUEST))
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.events = queue.Queue(maxsize=queue_size)
+
+        self.http = requests.Session()
+        self.http.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.http.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+        self.spool = spool
+        self.breaker = breaker or CircuitBreaker()
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.replay_interval = replay_interval
+        self.replay_delay = retry_base_delay
+
+        self.worker = None
+        self.replayer = None
+        self.start_lock = threading.Lock()
+        self.stopping = threading.Event()
+
+        # Metryki (wątki requestów piszą enqueued/dropped, wątek wysyłający resztę)
+        self.lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.sent_events = 0
+        self.failed_events = 0
+        self.requests_sent = 0
+        self.last_send_ms = 0.0
+        self.total_send_ms = 0.0
+        self.max_send_ms = 0.0
+
+    def start(self):
+        """Uruchamia wątek wysyłający i replay bufora dyskowego (leniwie - przy pierwszym zdarzeniu)"""
+        with self.start_lock:
+            self.stopping.clear()
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, name='ga4-dispatcher', daemon=True)
+                self.worker.start()
+            if self.spool is not None and (self.replayer is None or not self.replayer.is_alive()):
+                self.replayer = threading.Thread(target=self.replay_loop, name='ga4-replayer', daemon=True)
+                self.replayer.start()
+
+    def enqueue(self, client_id: str, name: str, params: Dict) -> bool:
+        """Wrzuca zdarzenie do kolejki - False gdy kolejka pełna (zdarzenie odrzucone)
+
+        Czas zdarzenia (timestamp_micros) jest zapisywany tutaj - wysyłka z bufora dyskowego
+        po awarii endpointu nie przesuwa zdarzeń na czas replay.
+        """
+        if self.worker is None:
+            self.start()
+        event = {'name': name, 'params': params, 'timestamp_micros': int(time.time() * 1_000_000)}
+        try:
+            self.events.put_nowait((client_id, event))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+        with self.lock:
+            self.enqueued += 1
+        return True
+
+    def collect_batch(self) -> List[Tuple[str, Dict]]:
+        """Czeka na pierwsze zdarzenie, potem dobiera kolejne do batch_size albo upływu flush_interval"""
+        try:
+            batch = [self.events.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.stopping.is_set():
+                break
+            try:
+                batch.append(self.events.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        """Pętla wątku wysyłającego - kończy się po close() i opróżnieniu kolejki"""
+        while not (self.stopping.is_set() and self.events.empty()):
+            batch = self.collect_batch()
+            if batch:
+                self.send_batch(batch)
+
+    def send_batch(self, batch: List[Tuple[str, Dict]]) -> bool:
+        """Wysyła partię - jedno żądanie na client_id (zdarzenia w żądaniu dzielą client_id)"""
+        grouped = OrderedDict()
+        for client_id, event in batch:
+            grouped.setdefault(client_id, []).append(event)
+
+        success = True
+        for client_id, events in grouped.items():
+            for start in range(0, len(events), self.batch_size):
+                chunk = events[start:start + self.batch_size]
+                # Otwarty obwód - endpoint leży, nie czekamy na timeout tylko od razu odkładamy na dysk
+                if self.breaker.allow():
+                    result = self.post(client_id, chunk)
+                else:
+                    result = SEND_RETRY
+                    if self.spool is None:
+                        # Bez bufora dyskowego zdarzenia przy otwartym obwodzie przepadają
+                        with self.lock:
+                            self.dropped += len(chunk)
+                if result == SEND_RETRY and self.spool is not None:
+                    self.spool_events(client_id, chunk)
+                success &= result == SEND_OK
+        return success
+
+    def spool_events(self, client_id: str, events: List[Dict]):
+        """Odkłada zdarzenia do bufora dyskowego (replay wyśle je po powrocie endpointu)"""
+        try:
+            self.spool.append([{'client_id': client_id, 'event': event} for event in events])
+        except OSError as e:
+            with self.lock:
+                self.dropped += len(events)
+            print(f"[GA4] 💥 Spool write failed, {len(events)} event(s) lost: {e}")
+
+    def post(self, client_id: str, events: List[Dict]) -> str:
+        """Jedno żądanie Measurement Protocol - zwraca SEND_OK / SEND_RETRY / SEND_REJECTED"""
+        params = {'measurement_id': self.measurement_id, 'api_secret': self.api_secret}
+        payload = {'client_id': client_id, 'events': events}
+
+        started = time.perf_counter()
+        try:
+            response = self.http.post(self.endpoint, params=params, json=payload, timeout=self.timeout)
+            status = response.status_code
+            if 200 <= status < 300:
+                result = SEND_OK
+            elif status == 429 or status >= 500:
+                result = SEND_RETRY
+            else:
+                result = SEND_REJECTED
+        except requests.RequestException as e:
+            status = e
+            result = SEND_RETRY
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if result == SEND_RETRY:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+        with self.lock:
+            self.requests_sent += 1
+            self.last_send_ms = elapsed_ms
+            self.total_send_ms += elapsed_ms
+            self.max_send_ms = max(self.max_send_ms, elapsed_ms)
+            if result == SEND_OK:
+                self.sent_events += len(events)
+            else:
+                self.failed_events += len(events)
+
+        if result == SEND_OK:
+            print(f"[GA4] ✅ Sent {len(events)} event(s) in {elapsed_ms:.0f} ms")
+        else:
+            print(f"[GA4] ❌ Failed to send {len(events)} event(s): {status}")
+        return result
+
+    def replay_loop(self):
+        """Wątek replay - wysyła segmenty bufora od najstarszego; po błędzie czeka z backoffem wykładniczym"""
+        while not self.stopping.is_set():
+            retry_after = self.breaker.retry_after()
+            if retry_after > 0:
+                self.stopping.wait(retry_after)
+                continue
+
+            segment = self.spool.claim_oldest_segment()
+            if segment is None:
+                self.stopping.wait(self.replay_interval)
+                continue
+
+            try:
+                replayed = self.replay_segment(segment)
+            except Exception as e:
+                # Wątek replay nie może zginąć po cichu - błąd (np. zapis .ack) traktujemy jak nieudaną wysyłkę
+                print(f"[GA4] 💥 Replay of {segment} failed: {e}")
+                replayed = False
+            finally:
+                self.spool.release_segment(segment)
+            if replayed:
+                self.replay_delay = self.retry_base_delay
+                continue
+
+            # Jitter - wiele instancji nie uderza w endpoint jednocześnie
+            self.stopping.wait(self.replay_delay * random.uniform(0.5, 1.0))
+            self.replay_delay = min(self.replay_delay * 2, self.retry_max_delay)
+
+    def replay_segment(self, segment: str) -> bool:
+        """Wysyła niepotwierdzone rekordy segmentu; True = segment wysłany w całości i usunięty"""
+        # Rekord z poprawną sumą kontrolną, ale bez pól zdarzenia - pomijany (potwierdzenie go przeskoczy)
+        records = [(offset, record) for offset, record in self.spool.read_segment(segment)
+                   if isinstance(record, dict) and 'client_id' in record and 'event' in record]
+
+        start = 0
+        while start < len(records):
+            if self.stopping.is_set() or not self.breaker.allow():
+                return False
+
+            # Kolejne rekordy z tym samym client_id - jedno żądanie (zachowujemy kolejność segmentu)
+            client_id = records[start][1]['client_id']
+            end = start + 1
+            while (end < len(records) and end - start < self.batch_size
+                   and records[end][1]['client_id'] == client_id):
+                end += 1
+
+            result = self.post(client_id, [record['event'] for _, record in records[start:end]])
+            if result == SEND_RETRY:
+                return False
+            # SEND_REJECTED też potwierdzamy - ponowna wysyłka nic nie zmieni
+            self.spool.acknowledge(segment, records[end - 1][0], end - start)
+            start = end
+
+        self.spool.remove_segment(segment)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """Zatrzymuje wątki po wysłaniu zdarzeń z kolejki (przy zamykaniu aplikacji)
+
+        Zdarzenia, które nie zdążyły wyjść przed timeoutem, trafiają do bufora dyskowego.
+        """
+        self.stopping.set()
+        for thread in (self.worker, self.replayer):
+            if thread is not None:
+                thread.join(timeout)
+
+        if self.spool is not None:
+            leftover = []
+            while True:
+                try:
+                    leftover.append(self.events.get_nowait())
+                except queue.Empty:
+                    break
+            if leftover:
+                self.spool.append([{'client_id': client_id, 'event': event} for client_id, event in leftover])
+            self.spool.close_segment()
+        self.http.close()
+
+    def stats(self) -> Dict:
+        """Statystyki do monitoringu"""
+        with self.lock:
+            return {
+                'queue_depth': self.events.qsize(),
+                'queue_size': self.events.maxsize,
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'sent_events': self.sent_events,
+                'failed_events': self.failed_events,
+                'requests': self.requests_sent,
+                'last_send_ms': round(self.last_send_ms, 1),
+                'avg_send_ms': round(self.total_send_ms / self.requests_sent, 1) if self.requests_sent else 0.0,
+                'max_send_ms': round(self.max_send_ms, 1),
+                'circuit_breaker': self.breaker.stats(),
+                'spool': self.spool.stats() if self.spool is not None else None
+            }
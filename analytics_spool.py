@@ -0,0 +1,282 @@
+"""
+Uniwersalny Żołnierz - Trwały bufor dyskowy zdarzeń analitycznych
+Niewysłane zdarzenia trafiają do plików segmentów (rekord = suma kontrolna + JSON) i są wysyłane ponownie
+"""
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Brak flock (Windows) - bufor bezpieczny tylko dla jednego procesu
+    fcntl = None
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.log'
+ACK_SUFFIX = '.ack'
+
+
+def encode_record(record: Dict) -> bytes:
+    """Linia segmentu: crc32 (hex) + spacja + JSON + \\n"""
+    data = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return b'%08x %s\n' % (zlib.crc32(data), data)
+
+
+def decode_record(line: bytes) -> Optional[Dict]:
+    """Rekord z linii segmentu - None gdy suma kontrolna się nie zgadza (uszkodzony zapis)"""
+    checksum, _, data = line.rstrip(b'\n').partition(b' ')
+    try:
+        if int(checksum, 16) != zlib.crc32(data):
+            return None
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+def lock_file(f, blocking: bool = True) -> bool:
+    """flock LOCK_EX na pliku - False gdy blocking=False i plik trzyma inny proces/deskryptor"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        return True
+    except BlockingIOError:
+        return False
+
+
+class EventSpool:
+    """Katalog segmentów append-only - zapis do aktywnego segmentu, odczyt od najstarszego zamkniętego
+
+    Katalog może być współdzielony przez kilka procesów (workery gunicorna): każdy segment jest tworzony
+    na wyłączność (O_EXCL) i trzymany pod flock przez proces, który do niego pisze, a replay bierze
+    flock na czas wysyłki - cudzy aktywny segment i segment wysyłany przez inny proces są pomijane.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 1 << 20):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.lock = threading.Lock()
+        self.active_path = None
+        self.active_file = None
+        self.next_sequence = None
+        self.claims = {}  # segment -> plik z flock trzymanym przez replay
+
+        self.spooled = 0
+        self.replayed = 0
+        self.corrupt = 0
+
+    def segment_paths(self) -> List[str]:
+        """Segmenty w kolejności zapisu (numer sekwencyjny w nazwie)"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def open_segment(self):
+        """Nowy aktywny segment (katalog tworzony dopiero przy pierwszym zapisie)"""
+        if self.next_sequence is None:
+            os.makedirs(self.directory, exist_ok=True)
+            existing = self.segment_paths()
+            last = os.path.basename(existing[-1]) if existing else None
+            self.next_sequence = int(last[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1 if last else 1
+
+        # Inny proces mógł już zająć ten numer - tworzymy plik na wyłączność i bierzemy kolejny wolny
+        while True:
+            path = os.path.join(self.directory, f'{SEGMENT_PREFIX}{self.next_sequence:010d}{SEGMENT_SUFFIX}')
+            self.next_sequence += 1
+            try:
+                segment_file = open(path, 'xb')
+                break
+            except FileExistsError:
+                continue
+
+        # flock aż do zamknięcia segmentu - replay innych procesów go nie ruszy
+        lock_file(segment_file)
+        # .ack bez segmentu (awaria w trakcie remove_segment) pominąłby początek nowego segmentu o tym numerze
+        try:
+            os.remove(path + ACK_SUFFIX)
+        except FileNotFoundError:
+            pass
+        self.active_path = path
+        self.active_file = segment_file
+
+    def close_segment(self):
+        if self.active_file is not None:
+            self.active_file.close()
+        self.active_file = None
+        self.active_path = None
+
+    def append(self, records: List[Dict]):
+        """Dopisuje rekordy i robi fsync - po powrocie zdarzenia przetrwają restart procesu"""
+        if not records:
+            return
+        data = b''.join(encode_record(record) for record in records)
+        with self.lock:
+            if self.active_file is None:
+                self.open_segment()
+            self.active_file.write(data)
+            self.active_file.flush()
+            os.fsync(self.active_file.fileno())
+            self.spooled += len(records)
+            if self.active_file.tell() >= self.segment_max_bytes:
+                self.close_segment()
+
+    def claim_oldest_segment(self) -> Optional[str]:
+        """Najstarszy segment do wysłania, zablokowany flock do release_segment/remove_segment
+
+        Własny aktywny segment jest najpierw zamykany (dalsze zapisy idą do nowego); puste segmenty
+        (świeżo utworzone przez inny proces) i segmenty zablokowane przez inne procesy są pomijane.
+        """
+        for path in self.segment_paths():
+            with self.lock:
+                if path == self.active_path:
+                    if self.active_file.tell() == 0:
+                        continue
+                    self.close_segment()
+
+            try:
+                segment_file = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            if not lock_file(segment_file, blocking=False):
+                segment_file.close()
+                continue
+
+            # Po zdobyciu blokady: segment mógł zostać w międzyczasie wysłany i usunięty przez inny proces
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            opened = os.fstat(segment_file.fileno())
+            if current is None or current.st_ino != opened.st_ino or opened.st_size == 0:
+                segment_file.close()
+                continue
+
+            self.claims[path] = segment_file
+            return path
+        return None
+
+    def release_segment(self, path: str):
+        """Zwalnia blokadę segmentu (wysyłka przerwana - segment zostaje na dysku)"""
+        segment_file = self.claims.pop(path, None)
+        if segment_file is not None:
+            segment_file.close()
+
+    def read_segment(self, path: str) -> List[Tuple[int, Dict]]:
+        """Niepotwierdzone rekordy segmentu jako (offset końca rekordu, rekord)"""
+        offset = self.acknowledged_offset(path)
+        records = []
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                offset += len(line)
+                if not line.endswith(b'\n'):
+                    # Urwany ostatni zapis (np. awaria w trakcie append) - pomijamy
+                    self.corrupt += 1
+                    break
+                record = decode_record(line)
+                if record is None:
+                    self.corrupt += 1
+                    continue
+                records.append((offset, record))
+        return records
+
+    def acknowledged_offset(self, path: str) -> int:
+        try:
+            with open(path + ACK_SUFFIX, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def acknowledge(self, path: str, offset: int, count: int):
+        """Zapisuje postęp wysyłki segmentu (atomowo) - po restarcie wysłane rekordy nie wrócą"""
+        temporary = path + ACK_SUFFIX + '.tmp'
+        with open(temporary, 'w') as f:
+            f.write(str(offset))
+        os.replace(temporary, path + ACK_SUFFIX)
+        with self.lock:
+            self.replayed += count
+
+    def remove_segment(self, path: str):
+        """Usuwa w całości wysłany segment (przed zwolnieniem blokady)
+
+        Najpierw .ack - po awarii w połowie zostaje segment do ponownej wysyłki, a nie osierocony .ack.
+        """
+        for file_path in (path + ACK_SUFFIX, path):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+        self.release_segment(path)
+
+    def stats(self) -> Dict:
+        """Statystyki do monitoringu"""
+        with self.lock:
+            paths = self.segment_paths()
+            size = 0
+            for path in paths:
+                try:
+                    size += os.path.getsize(path)
+                except FileNotFoundError:
+                    pass  # segment wysłany i usunięty przez inny proces
+            return {
+                'directory': self.directory,
+                'segments': len(paths),
+                'bytes': size,
+                'spooled_events': self.spooled,
+                'replayed_events': self.replayed,
+                'corrupt_records': self.corrupt
+            }
+
+
+class CircuitBreaker:
+    """Po failure_threshold kolejnych błędach przestaje wołać endpoint na reset_timeout sekund"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def allow(self) -> bool:
+        """Czy wolno wysłać żądanie (po reset_timeout otwarty obwód przepuszcza próbę - half_open)"""
+        with self.lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            return self.state != 'open'
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.trips += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        """Sekundy do kolejnej próby (0 gdy obwód nie jest otwarty)"""
+        with self.lock:
+            if self.state != 'open':
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'trips': self.trips
+            }
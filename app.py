@@ -1,8 +1,11 @@
 from flask import Flask, render_template, request, jsonify, session
 from flask_socketio import SocketIO, emit
 from datetime import timedelta, datetime
-from ecommerce_bot import EcommerceBot
-import sqlite3
+from ecommerce_bot import EcommerceBot, CatalogValidationError
+from burst_coalescer import BurstCoalescer
+from sqlite_pool import SQLitePool
+from write_behind import GroupCommitWriter
+import atexit
 import json
 import time
 import random
@@ -41,6 +44,61 @@ LOST_DEMAND_LOG = 'lost_demand_log.csv'
 
 # Dashboard database configuration
 DATABASE_NAME = 'dashboard.db'
+DATABASE_READERS = int(os.getenv('DATABASE_READERS', '4'))
+
+# Zapis zdarzeń dashboardu partiami: okno trwałości (ms, 0 = zapis synchroniczny) i rozmiar partii
+EVENTS_FLUSH_MS = float(os.getenv('EVENTS_FLUSH_MS', '50'))
+EVENTS_FLUSH_ROWS = int(os.getenv('EVENTS_FLUSH_ROWS', '200'))
+EVENTS_MAX_PENDING = int(os.getenv('EVENTS_MAX_PENDING', '10000'))
+# Ile ID zdarzeń proces rezerwuje naraz (niewykorzystane ID z bloku zostają lukami w numeracji)
+EVENTS_ID_BLOCK = int(os.getenv('EVENTS_ID_BLOCK', '1000'))
+
+EVENT_INSERT_SQL = '''
+    INSERT INTO events (id, query_text, decision, details, category, brand_type, potential_value, explanation)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Trwałe połączenia do bazy dashboardu (WAL): jedno zapisujące + pula odczytu
+db_pool = SQLitePool(DATABASE_NAME, readers=DATABASE_READERS)
+atexit.register(db_pool.close)
+
+def reserve_event_ids(count):
+    """Rezerwuje blok count ID zdarzeń przesuwając sqlite_sequence - zwraca pierwsze ID bloku
+
+    AUTOINCREMENT i pozostałe procesy (workery gunicorna) nadają ID dopiero za zarezerwowanym blokiem.
+    UPDATE bierze blokadę zapisu, więc odczyt i przesunięcie licznika są atomowe między procesami.
+    """
+    with db_pool.writer() as conn:
+        updated = conn.execute('''
+            UPDATE sqlite_sequence SET seq = MAX(seq, (SELECT COALESCE(MAX(id), 0) FROM events)) + ?
+            WHERE name = 'events'
+        ''', (count,)).rowcount
+        if not updated:
+            # Pusta tabela, do której jeszcze nic nie wstawiono - brak wiersza w sqlite_sequence
+            conn.execute('''
+                INSERT INTO sqlite_sequence (name, seq) SELECT 'events', COALESCE(MAX(id), 0) + ? FROM events
+            ''', (count,))
+        last = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()[0]
+    return last - count + 1
+
+# Write-behind: add_event wraca od razu z tymczasowym ID (z bloku procesu), wiersze zapisywane executemany
+# w jednej transakcji (zamykany przed db_pool - atexit wywołuje funkcje w odwrotnej kolejności)
+event_writer = GroupCommitWriter(
+    db_pool, EVENT_INSERT_SQL, reserve_event_ids, flush_interval=EVENTS_FLUSH_MS / 1000,
+    flush_rows=EVENTS_FLUSH_ROWS, max_pending=EVENTS_MAX_PENDING, id_block=EVENTS_ID_BLOCK
+)
+atexit.register(event_writer.close)
+
+# Batch analysis limits
+BATCH_MAX_QUERIES = int(os.getenv('BATCH_MAX_QUERIES', '50000'))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', str(os.cpu_count() or 1)))
+
+# Zwijanie serii naciśnięć klawiszy w podpowiedziach: sekundy ciszy, po których zapytanie jest ustalone
+# (0 = każde zapytanie od razu trafia do dashboardu, GA4 i logu utraconego popytu)
+SUGGESTION_IDLE_WINDOW = float(os.getenv('SUGGESTION_IDLE_WINDOW', '1.5'))
+
+# Token do endpointów administracyjnych (nagłówek X-Admin-Token); pusty = tylko tryb debug
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
 
 # === DASHBOARD CLASSES ===
 class TacticalDataSimulator:
@@ -282,7 +340,13 @@ class DatabaseManager:
     @staticmethod
     def initialize_database():
         """Tworzy tabelę events jeśli nie istnieje"""
-        conn = sqlite3.connect(DATABASE_NAME)
+        with db_pool.writer() as conn:
+            DatabaseManager.create_schema(conn)
+        print("[DATABASE] Events table initialized")
+    
+    @staticmethod
+    def create_schema(conn):
+        """Tabela events + indeksy"""
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -302,44 +366,25 @@ class DatabaseManager:
         # Dodaj indeksy dla wydajności
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON events(timestamp)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_decision ON events(decision)')
-        
-        conn.commit()
-        conn.close()
-        print("[DATABASE] Events table initialized")
     
     @staticmethod
     def add_event(query_text, decision, details, category, brand_type, potential_value, explanation):
-        """Dodaje nowe zdarzenie do bazy"""
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO events (query_text, decision, details, category, brand_type, potential_value, explanation)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (query_text, decision, details, category, brand_type, potential_value, explanation))
-        
-        event_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        return event_id
+        """Dodaje nowe zdarzenie do bazy (zapis odroczony - zwraca tymczasowe ID, zwykle identyczne z zapisanym)"""
+        return event_writer.add(
+            (query_text, decision, details, category, brand_type, potential_value, explanation)
+        )
     
     @staticmethod
     def get_recent_events(limit=10):
         """Pobiera ostatnie wydarzenia"""
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, timestamp, query_text, decision, details, category, 
-                   brand_type, potential_value, explanation
-            FROM events 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        ''', (limit,))
-        
-        events = cursor.fetchall()
-        conn.close()
+        with db_pool.reader() as conn:
+            events = conn.execute('''
+                SELECT id, timestamp, query_text, decision, details, category, 
+                       brand_type, potential_value, explanation
+                FROM events 
+                ORDER BY timestamp DESC 
+                LIMIT ?
+            ''', (limit,)).fetchall()
         
         return [
             {
@@ -359,21 +404,16 @@ class DatabaseManager:
     @staticmethod
     def get_today_statistics():
         """Pobiera statystyki z dzisiejszego dnia"""
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        
         today = datetime.now().strftime('%Y-%m-%d')
         
         # Zlicz wydarzenia według typu decyzji
-        cursor.execute('''
-            SELECT decision, COUNT(*) as count, COALESCE(SUM(potential_value), 0) as total_value
-            FROM events 
-            WHERE date(timestamp) = ?
-            GROUP BY decision
-        ''', (today,))
-        
-        results = cursor.fetchall()
-        conn.close()
+        with db_pool.reader() as conn:
+            results = conn.execute('''
+                SELECT decision, COUNT(*) as count, COALESCE(SUM(potential_value), 0) as total_value
+                FROM events 
+                WHERE date(timestamp) = ?
+                GROUP BY decision
+            ''', (today,)).fetchall()
         
         stats = {
             'UTRACONE OKAZJE': {'count': 0, 'value': 0},
@@ -391,24 +431,19 @@ class DatabaseManager:
     @staticmethod
     def get_top_missing_products(limit=5):
         """Pobiera najczęściej poszukiwane brakujące produkty"""
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        
         # Ostatnie 7 dni, tylko UTRACONY POPYT
         week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
         
-        cursor.execute('''
-            SELECT category, COUNT(*) as frequency, SUM(potential_value) as total_value
-            FROM events 
-            WHERE decision = 'UTRACONE OKAZJE' 
-            AND date(timestamp) >= ?
-            GROUP BY category
-            ORDER BY frequency DESC, total_value DESC
-            LIMIT ?
-        ''', (week_ago, limit))
-        
-        results = cursor.fetchall()
-        conn.close()
+        with db_pool.reader() as conn:
+            results = conn.execute('''
+                SELECT category, COUNT(*) as frequency, SUM(potential_value) as total_value
+                FROM events 
+                WHERE decision = 'UTRACONE OKAZJE' 
+                AND date(timestamp) >= ?
+                GROUP BY category
+                ORDER BY frequency DESC, total_value DESC
+                LIMIT ?
+            ''', (week_ago, limit)).fetchall()
         
         return [
             {
@@ -418,6 +453,21 @@ class DatabaseManager:
             }
             for row in results
         ]
+    
+    @staticmethod
+    def clear_old_events(days=30):
+        """Usuwa zdarzenia starsze niż podana liczba dni - zwraca liczbę usuniętych"""
+        cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        with db_pool.writer() as conn:
+            return conn.execute('DELETE FROM events WHERE date(timestamp) < ?', (cutoff_date,)).rowcount
+    
+    @staticmethod
+    def clear_all_events():
+        """Czyści tabelę events (reset demo)"""
+        # Najpierw zapisz bufor - inaczej zdarzenia sprzed resetu pojawiłyby się po nim
+        event_writer.flush()
+        with db_pool.writer() as conn:
+            conn.execute('DELETE FROM events')
 
 # Globalny symulator
 simulator = TacticalDataSimulator()
@@ -456,6 +506,7 @@ def bot_start():
         session['cart'] = []
         session['context'] = None
         session['machine_filter'] = None
+        session['search_session_id'] = str(uuid.uuid4())
         
         # Get initial greeting
         initial_response = bot.get_initial_greeting()
@@ -547,22 +598,29 @@ def search_suggestions():
             # Search products with intent analysis
             machine_filter = session.get('machine_filter')
             
+            if not session.get('search_session_id'):
+                session['search_session_id'] = str(uuid.uuid4())
+            
+            # Incremental mode - kolejne znaki zawężają wyniki poprzedniego zapytania sesji
+            search_session = session['search_session_id'] if data.get('incremental') else None
+            
             result = bot.get_fuzzy_product_matches(
-                query, machine_filter, limit=6, analyze_intent=True
+                query, machine_filter, limit=6, analyze_intent=True,
+                search_session=search_session
             )
             
             if isinstance(result, tuple) and len(result) == 4:
                 # New format with analysis
                 products, confidence_level, suggestion_type, analysis = result
                 
-                # NOWA INTEGRACJA - Wyślij do dashboardu
-                send_event_to_dashboard_internal(query, confidence_level)
-                
-                # Determine GA4 event
-                ga4_event_data = bot.determine_ga4_event(analysis)
-                if ga4_event_data:
-                    ga4_event = ga4_event_data['event']
-                    bot.send_ga4_event(ga4_event_data)
+                # Dashboard, GA4 i log utraconego popytu dopiero dla ustalonego zapytania serii
+                # ("am", "amo", ... zwinięte do "amortyzator bilstein")
+                ga4_event = analysis['ga4_event']
+                suggestion_coalescer.submit(
+                    session['search_session_id'], query,
+                    # Filtr rozwiązany tutaj - ustalenie serii działa w wątku coalescera, bez kontekstu requestu
+                    (confidence_level, analysis, session.get('machine_filter') or 'all')
+                )
                 
                 # Prepare suggestions
                 for product, score in products:
@@ -577,10 +635,6 @@ def search_suggestions():
                         'stock_status': stock_status,
                         'brand': product['brand']
                     })
-                
-                # Log lost demand if needed
-                if confidence_level == 'NO_MATCH':
-                    log_lost_demand(query, analysis)
         
         print(f"[SUGGESTIONS] Query: '{query}' | Type: {search_type} | Confidence: {confidence_level} | GA4: {ga4_event}")
         
@@ -597,6 +651,51 @@ def search_suggestions():
         traceback.print_exc()
         return jsonify({'suggestions': [], 'error': str(e)}), 200
 
+@app.route('/motobot-prototype/analyze-batch', methods=['POST'])
+def analyze_batch():
+    """Batch intent classification for offline jobs - no GA4, dashboard or lost demand side effects"""
+    try:
+        data = request.get_json() or {}
+        queries = data.get('queries', [])
+        
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            return jsonify({'status': 'error', 'message': 'queries must be a list of strings'}), 400
+        
+        if len(queries) > BATCH_MAX_QUERIES:
+            return jsonify({
+                'status': 'error',
+                'message': f'Too many queries ({len(queries)}), limit is {BATCH_MAX_QUERIES}'
+            }), 413
+        
+        try:
+            workers = max(0, min(int(data.get('workers', 0)), BATCH_MAX_WORKERS))
+        except (TypeError, ValueError):
+            return jsonify({'status': 'error', 'message': 'workers must be an integer'}), 400
+        normalize = bool(data.get('normalize', True))
+        machine_filter = data.get('machine_filter') or None
+        if machine_filter is not None and not isinstance(machine_filter, str):
+            return jsonify({'status': 'error', 'message': 'machine_filter must be a string'}), 400
+        
+        started = time.time()
+        # analyze_batch sama pilnuje huba eventlet (tpool dla analizy w procesie, pula procesów na hubie)
+        results = bot.analyze_batch(queries, workers, normalize, machine_filter)
+        elapsed_ms = round((time.time() - started) * 1000, 1)
+        
+        print(f"[BATCH] Analyzed {len(queries)} queries in {elapsed_ms} ms (workers: {workers})")
+        
+        return jsonify({
+            'status': 'success',
+            'count': len(results),
+            'elapsed_ms': elapsed_ms,
+            'results': results
+        })
+    
+    except Exception as e:
+        print(f"[ERROR] Analyze batch error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 # === DASHBOARD API ROUTES ===
 @app.route('/dashboard')
 def dashboard():
@@ -627,11 +726,7 @@ def get_initial_data():
 def reset_demo():
     """Resetuje demo - czyści bazę i restartuje symulację"""
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM events')
-        conn.commit()
-        conn.close()
+        DatabaseManager.clear_all_events()
         
         return jsonify({'status': 'success', 'message': 'Demo reset successfully'})
     except Exception as e:
@@ -750,6 +845,38 @@ def track_analytics():
         print(f"[ERROR] Track analytics error: {e}")
         return jsonify({'status': 'error', 'error': str(e)}), 500
 
+def admin_authorized():
+    """Dostęp do endpointów administracyjnych - token z ADMIN_TOKEN albo tryb debug"""
+    if ADMIN_TOKEN:
+        return request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+    return app.debug
+
+@app.route('/motobot-prototype/admin/reload-catalog', methods=['POST'])
+def reload_catalog():
+    """Hot reload of the product catalog - new snapshot is built in the background and swapped atomically"""
+    if not admin_authorized():
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    source = data.get('source') or None
+    
+    if data.get('wait'):
+        try:
+            stats = bot.reload_catalog(source)
+        except RuntimeError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 409
+        except CatalogValidationError as e:
+            return jsonify({'status': 'error', 'message': str(e), 'reload': bot.catalog_reload_status}), 422
+        except Exception as e:
+            return jsonify({'status': 'error', 'message': str(e), 'reload': bot.catalog_reload_status}), 500
+        return jsonify({'status': 'success', 'catalog': stats, 'reload': bot.catalog_reload_status})
+    
+    if not bot.start_catalog_reload(source):
+        return jsonify({'status': 'error', 'message': 'Catalog reload already in progress',
+                        'reload': bot.catalog_reload_status}), 409
+    
+    return jsonify({'status': 'accepted', 'catalog_version': bot.catalog_version}), 202
+
 @app.route('/motobot-prototype/health')
 def health_check():
     """Health check endpoint with system status"""
@@ -767,6 +894,14 @@ def health_check():
             'dashboard_integration': True,
             'real_time_websocket': True
         },
+        'catalog': bot.catalog_stats,
+        'catalog_reload': bot.catalog_reload_status,
+        'search_cache': bot.search_cache.stats(),
+        'token_score_cache': bot.token_score_cache.stats(),
+        'ga4_dispatcher': bot.ga4_dispatcher.stats(),
+        'suggestion_coalescer': suggestion_coalescer.stats(),
+        'database_pool': db_pool.stats(),
+        'event_writer': event_writer.stats(),
         'session_active': 'cart' in session
     })
 
@@ -833,8 +968,24 @@ def calculate_lost_value_internal(query):
     }
     return base_values.get(category, 150)
 
-def log_lost_demand(query, analysis):
-    """Helper function to log lost demand"""
+def settle_search_suggestion(query, payload):
+    """Zapisy dla ustalonego zapytania serii podpowiedzi - dashboard, GA4, utracony popyt"""
+    confidence_level, analysis, machine_filter = payload
+    
+    send_event_to_dashboard_internal(query, confidence_level)
+    
+    ga4_event_data = bot.determine_ga4_event(analysis)
+    if ga4_event_data:
+        bot.send_ga4_event(ga4_event_data)
+    
+    if confidence_level == 'NO_MATCH':
+        log_lost_demand(query, analysis, machine_filter)
+
+suggestion_coalescer = BurstCoalescer(settle_search_suggestion, idle_window=SUGGESTION_IDLE_WINDOW)
+atexit.register(suggestion_coalescer.close)
+
+def log_lost_demand(query, analysis, machine_filter):
+    """Helper function to log lost demand (bez dostępu do session - wołane poza kontekstem requestu)"""
     try:
         if not os.path.exists(LOST_DEMAND_LOG) or os.path.getsize(LOST_DEMAND_LOG) == 0:
             with open(LOST_DEMAND_LOG, 'w', newline='', encoding='utf-8') as csvfile:
@@ -848,7 +999,7 @@ def log_lost_demand(query, analysis):
                 query,
                 '',
                 False,
-                session.get('machine_filter', 'all')
+                machine_filter
             ])
         print(f"[LOST DEMAND AUTO] Logged: '{query}'")
     except Exception as e:
@@ -899,6 +1050,40 @@ def test_intent_analysis():
         })
     return jsonify({'error': 'Available only in debug mode'}), 403
 
+@app.route('/motobot-prototype/debug/scoring-engine-parity')
+def scoring_engine_parity():
+    """Debug endpoint - parity test between scalar and NumPy scoring engines"""
+    if app.debug:
+        test_queries = [scenario['query'] for scenario in simulator.battle_scenarios]
+        test_queries += [
+            "klocki golf",
+            "kloki glof",
+            "filtr mann bmw",
+            "amortyztor bilsten",
+            "bosh",
+            "ate",
+            "hu719",
+            "świeca zapłonowa ngk"
+        ]
+        
+        # Dodatkowo wszystkie prefiksy - tak jak przy wpisywaniu znak po znaku
+        for query in list(test_queries):
+            test_queries += [query[:i] for i in range(2, len(query))]
+        
+        parity = bot.compare_scoring_engines(
+            test_queries, machine_filters=(None, 'osobowy', 'dostawczy', 'motocykl')
+        )
+        
+        return jsonify({
+            'test': 'Scoring engine parity (scalar vs NumPy)',
+            'active_engine': 'numpy' if bot.vector_engine is not None else 'scalar',
+            'numpy_available': parity['available'],
+            'checked': parity['checked'],
+            'passed': parity['available'] and not parity['mismatches'],
+            'mismatches': parity['mismatches'][:20]
+        })
+    return jsonify({'error': 'Available only in debug mode'}), 403
+
 @app.route('/motobot-prototype/debug/lost-demand-report')
 def lost_demand_report():
     """Debug endpoint to view lost demand log"""
@@ -1063,13 +1248,7 @@ def stop_simulator():
         
         # Clear old events (older than 30 days)
         try:
-            conn = sqlite3.connect(DATABASE_NAME)
-            cursor = conn.cursor()
-            cutoff_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-            cursor.execute('DELETE FROM events WHERE date(timestamp) < ?', (cutoff_date,))
-            deleted_count = cursor.rowcount
-            conn.commit()
-            conn.close()
+            deleted_count = DatabaseManager.clear_old_events(30)
             if deleted_count > 0:
                 print(f"[DATABASE] Cleared {deleted_count} old events")
         except Exception as e:
@@ -0,0 +1,130 @@
+"""
+Uniwersalny Żołnierz - Zwijanie serii naciśnięć klawiszy w jedno zdarzenie
+Zapytanie częściowe ("am", "amo", ...) będące prefiksem kolejnego zapytania sesji nie generuje zapisów
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple
+
+
+class Burst(NamedTuple):
+    """Ostatnie zapytanie serii czekające na ustalenie"""
+    key: str
+    query: str
+    payload: Any
+    deadline: float
+
+
+class BurstCoalescer:
+    """Per sesja trzyma ostatnie zapytanie; settle(query, payload) woła dopiero dla ustalonego zapytania
+
+    Zapytanie jest ustalone, gdy przez idle_window sekund nie przyszło nic nowego w sesji
+    albo gdy kolejne zapytanie nie jest jego rozszerzeniem (użytkownik zaczął pisać coś innego).
+    """
+
+    def __init__(self, settle: Callable[[str, Any], None], idle_window: float = 1.5,
+                 max_sessions: int = 10000, tick: float = 0.25):
+        self.settle = settle
+        self.idle_window = idle_window
+        self.max_sessions = max_sessions
+        self.tick = tick
+        self.pending = OrderedDict()  # sesja -> Burst, w kolejności deadline
+
+        self.lock = threading.Lock()
+        self.worker = None
+        self.stopping = threading.Event()
+
+        self.submitted = 0
+        self.folded = 0
+        self.settled = 0
+
+    def start(self):
+        """Uruchamia wątek ustalający serie po upływie idle_window (leniwie - przy pierwszym zapytaniu)"""
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.stopping.clear()
+                self.worker = threading.Thread(target=self.run, name='burst-coalescer', daemon=True)
+                self.worker.start()
+
+    def submit(self, session_key: str, query: str, payload: Any) -> bool:
+        """Rejestruje zapytanie sesji - True gdy poprzednie zapytanie sesji zostało zwinięte (bez zapisów)"""
+        if self.idle_window <= 0:
+            with self.lock:
+                self.submitted += 1
+            self.settle_bursts([Burst('', query, payload, 0.0)])
+            return False
+        if self.worker is None:
+            self.start()
+
+        key = ' '.join(query.lower().split())
+        to_settle = []
+        with self.lock:
+            self.submitted += 1
+            previous = self.pending.pop(session_key, None)
+            folded = previous is not None and key.startswith(previous.key)
+            if folded:
+                self.folded += 1
+            elif previous is not None:
+                to_settle.append(previous)
+
+            self.pending[session_key] = Burst(key, query, payload, time.monotonic() + self.idle_window)
+
+            # Limit pamięci - najstarsze serie są ustalane przed czasem
+            while len(self.pending) > self.max_sessions:
+                to_settle.append(self.pending.popitem(last=False)[1])
+
+        self.settle_bursts(to_settle)
+        return folded
+
+    def flush_expired(self):
+        """Ustala serie, w których od ostatniego zapytania minęło idle_window"""
+        now = time.monotonic()
+        to_settle = []
+        with self.lock:
+            while self.pending:
+                session_key, burst = next(iter(self.pending.items()))
+                if burst.deadline > now:
+                    break
+                del self.pending[session_key]
+                to_settle.append(burst)
+        self.settle_bursts(to_settle)
+
+    def flush_all(self):
+        """Ustala wszystkie oczekujące serie (zamykanie aplikacji)"""
+        with self.lock:
+            to_settle = list(self.pending.values())
+            self.pending.clear()
+        self.settle_bursts(to_settle)
+
+    def settle_bursts(self, bursts: List[Burst]):
+        for burst in bursts:
+            try:
+                self.settle(burst.query, burst.payload)
+            except Exception as e:
+                print(f"[COALESCE] 💥 Settle failed for '{burst.query}': {e}")
+            with self.lock:
+                self.settled += 1
+
+    def run(self):
+        while not self.stopping.wait(self.tick):
+            self.flush_expired()
+
+    def close(self):
+        """Zatrzymuje wątek i ustala oczekujące serie"""
+        self.stopping.set()
+        if self.worker is not None:
+            self.worker.join(self.tick * 4)
+        self.flush_all()
+
+    def stats(self) -> Dict:
+        """Statystyki do monitoringu"""
+        with self.lock:
+            return {
+                'idle_window': self.idle_window,
+                'pending_sessions': len(self.pending),
+                'submitted': self.submitted,
+                'folded': self.folded,
+                'settled': self.settled,
+                'fold_rate': round(self.folded / self.submitted, 4) if self.submitted else 0.0
+            }
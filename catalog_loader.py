@@ -0,0 +1,124 @@
+"""
+Uniwersalny Żołnierz - Strumieniowy loader katalogu produktów
+Czyta produkty z JSONL, CSV lub tabeli SQLite bez wczytywania całego pliku do pamięci
+"""
+import csv
+import json
+import os
+import sqlite3
+from typing import Dict, Iterator, Optional
+
+from product_store import clamp_stock
+
+PRODUCT_FIELDS = ('id', 'name', 'category', 'machine', 'brand', 'model', 'price', 'stock')
+
+
+def normalize_product(record: Optional[Dict]) -> Optional[Dict]:
+    """Sprowadza rekord z pliku do formatu product_database (None = rekord odrzucony)"""
+    if not isinstance(record, dict):
+        # Uszkodzona linia JSONL albo linia, która nie jest obiektem
+        return None
+
+    product_id = str(record.get('id') or '').strip()
+    name = str(record.get('name') or '').strip()
+    if not product_id or not name:
+        return None
+
+    try:
+        price = float(record.get('price') or 0)
+        # Stan spoza zakresu kolumny stocks (array('i')) jest przycinany, nie psuje ładowania katalogu
+        stock = clamp_stock(int(float(record.get('stock') or 0)))
+    except (TypeError, ValueError, OverflowError):
+        # OverflowError - 'inf' w kolumnie stanu
+        return None
+
+    return {
+        'id': product_id,
+        'name': name,
+        'category': str(record.get('category') or '').strip(),
+        'machine': str(record.get('machine') or 'uniwersalny').strip(),
+        'brand': str(record.get('brand') or '').strip(),
+        'model': str(record.get('model') or '').strip(),
+        'price': price,
+        'stock': stock
+    }
+
+
+def iter_jsonl(path: str) -> Iterator[Optional[Dict]]:
+    """Jeden obiekt JSON na linię (None za linię, która nie jest poprawnym JSON-em - np. urwany zapis)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+
+
+def iter_csv(path: str) -> Iterator[Dict]:
+    """CSV z nagłówkiem zawierającym nazwy pól produktu (utf-8-sig - eksport z Excela zaczyna się od BOM)"""
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        yield from csv.DictReader(f)
+
+
+def iter_sqlite(path: str, table: str = 'products') -> Iterator[Dict]:
+    """Wiersze tabeli SQLite (kursor czyta partiami, nie całą tabelę naraz)"""
+    if not table.isidentifier():
+        raise ValueError(f"Invalid table name: {table}")
+
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        cursor = conn.execute(f'SELECT * FROM {table}')
+        for row in cursor:
+            yield dict(row)
+    finally:
+        conn.close()
+
+
+def iter_catalog(source: str, stats: Optional[Dict] = None) -> Iterator[Dict]:
+    """Strumień znormalizowanych produktów ze źródła
+
+    Obsługiwane źródła:
+      products.jsonl, products.csv,
+      products.db / products.sqlite (tabela 'products'),
+      products.db#nazwa_tabeli
+
+    stats - opcjonalny słownik, w którym zliczane są odrzucone rekordy ('skipped')
+    """
+    path, _, table = source.partition('#')
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension in ('.jsonl', '.ndjson'):
+        records = iter_jsonl(path)
+    elif extension == '.csv':
+        records = iter_csv(path)
+    elif extension in ('.db', '.sqlite', '.sqlite3'):
+        records = iter_sqlite(path, table or 'products')
+    else:
+        raise ValueError(f"Unsupported catalog source: {source}")
+
+    for record in records:
+        product = normalize_product(record)
+        if product is not None:
+            yield product
+        elif stats is not None:
+            stats['skipped'] = stats.get('skipped', 0) + 1
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Aktualne zużycie pamięci procesu (RSS) - do raportu z ładowania katalogu"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    try:
+        import resource
+        # ru_maxrss to szczyt, nie bieżąca wartość - lepsze to niż nic
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
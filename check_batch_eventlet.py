@@ -0,0 +1,112 @@
+"""
+Uniwersalny Żołnierz - Kontrola analizy wsadowej pod eventlet
+Uruchamia aplikację na serwerze eventlet (jak wsgi.py) i wysyła paczki do /motobot-prototype/analyze-batch
+w trybie jednoprocesowym i z pulą procesów - zawieszenie albo zamrożony hub kończą się kodem 1
+
+Użycie: python check_batch_eventlet.py
+"""
+import eventlet
+eventlet.monkey_patch()  # MUSI BYĆ JAKO PIERWSZE
+
+import io
+import json
+import os
+import signal
+import sys
+import time
+import urllib.error
+import urllib.request
+
+BATCH_TIMEOUT = float(os.getenv('CHECK_BATCH_TIMEOUT', '120'))
+MAX_HUB_STALL_MS = float(os.getenv('CHECK_MAX_HUB_STALL_MS', '500'))
+QUERY_COUNT = 1000
+WORKERS = 2
+
+
+def post_batch(port: int, payload: dict):
+    """POST paczki - (status HTTP, odpowiedź JSON)"""
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{port}/motobot-prototype/analyze-batch',
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def watchdog(signum, frame):
+    """Zawieszony hub nie obsłuży eventlet.Timeout - twardy limit na cały przebieg"""
+    print(f"[CHECK] ❌ check did not finish in {BATCH_TIMEOUT * 3:.0f}s - batch analysis hangs the process", flush=True)
+    os._exit(1)
+
+
+def main() -> int:
+    if hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, watchdog)
+        signal.alarm(int(BATCH_TIMEOUT * 3))
+
+    # Pula procesów ma się uruchomić także na maszynie z jednym rdzeniem
+    os.environ.setdefault('BATCH_MIN_PARALLEL', '10')
+    os.environ.setdefault('BATCH_MAX_WORKERS', str(WORKERS))
+    os.environ.setdefault('GA4_SPOOL_DIR', '')
+
+    from eventlet import wsgi
+    from app import app
+
+    listener = eventlet.listen(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    eventlet.spawn(wsgi.server, listener, app, log=io.StringIO())
+
+    # Zielony wątek mierzący opóźnienie huba - autocomplete na żywo musi działać w trakcie paczki
+    stalls = []
+
+    def hub_probe():
+        while True:
+            started = time.perf_counter()
+            eventlet.sleep(0.01)
+            stalls.append((time.perf_counter() - started - 0.01) * 1000)
+
+    eventlet.spawn(hub_probe)
+
+    queries = [f'klocki hamulcowe {i}' for i in range(QUERY_COUNT)]
+    failed = False
+
+    for workers in (0, WORKERS):
+        stalls.clear()
+        started = time.perf_counter()
+        try:
+            with eventlet.Timeout(BATCH_TIMEOUT):
+                status, body = post_batch(port, {'queries': queries, 'workers': workers})
+        except eventlet.Timeout:
+            print(f"[CHECK] ❌ workers={workers}: no response after {BATCH_TIMEOUT:.0f}s")
+            failed = True
+            continue
+
+        elapsed = time.perf_counter() - started
+        max_stall = max(stalls, default=0.0)
+        if status != 200 or body.get('count') != len(queries):
+            print(f"[CHECK] ❌ workers={workers}: HTTP {status}, {body.get('message', body.get('count'))}")
+            failed = True
+        elif max_stall > MAX_HUB_STALL_MS:
+            print(f"[CHECK] ❌ workers={workers}: hub blocked for {max_stall:.0f} ms")
+            failed = True
+        else:
+            print(f"[CHECK] ✅ workers={workers}: {body['count']} queries in {elapsed:.2f}s, "
+                  f"max hub stall {max_stall:.0f} ms")
+
+    status, body = post_batch(port, {'queries': ['klocki'], 'machine_filter': ['motocykl']})
+    if status != 400:
+        print(f"[CHECK] ❌ machine_filter as list: expected HTTP 400, got {status}")
+        failed = True
+    else:
+        print("[CHECK] ✅ machine_filter as list rejected with 400")
+
+    sys.stdout.flush()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Uniwersalny Żołnierz - Kontrola bufora dyskowego GA4 na lokalnym stubie endpointu
+Endpoint leży (503) -> zdarzenia trafiają na dysk; endpoint wraca -> replay wysyła każde zdarzenie dokładnie raz,
+z czasem z chwili enqueue. Dowolny błąd kończy się kodem 1
+
+Użycie: python check_ga4_spool.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+from analytics_dispatch import GA4Dispatcher
+from analytics_spool import ACK_SUFFIX, CircuitBreaker, EventSpool, SEGMENT_PREFIX, SEGMENT_SUFFIX
+from ga4_stub_server import GA4StubServer
+
+EVENT_COUNT = 120
+DRAIN_TIMEOUT = 30.0
+
+
+def wait_for(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def make_dispatcher(endpoint: str, directory: str) -> GA4Dispatcher:
+    return GA4Dispatcher(
+        'G-STUB', 'stub-secret', endpoint=endpoint, flush_interval=0.05, timeout=2.0,
+        spool=EventSpool(directory, segment_max_bytes=4096),
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.3),
+        retry_base_delay=0.05, retry_max_delay=0.5, replay_interval=0.1
+    )
+
+
+def check_outage_and_recovery(stub: GA4StubServer, directory: str) -> list:
+    """503 -> bufor dyskowy; 204 -> replay wysyła każde zdarzenie raz, z oryginalnym czasem"""
+    errors = []
+    stub.set_status(503)
+    dispatcher = make_dispatcher(stub.endpoint, directory)
+
+    enqueued_at = int(time.time() * 1_000_000)
+    for i in range(EVENT_COUNT):
+        dispatcher.enqueue(f'client-{i % 7}', 'search', {'seq': i})
+    if not wait_for(lambda: dispatcher.spool.stats()['spooled_events'] >= EVENT_COUNT, DRAIN_TIMEOUT):
+        errors.append(f"only {dispatcher.spool.stats()['spooled_events']}/{EVENT_COUNT} events spooled during outage")
+
+    time.sleep(0.5)
+    recovered_at = int(time.time() * 1_000_000)
+    stub.set_status(204)
+    if not wait_for(lambda: len(stub.events()) >= EVENT_COUNT and not dispatcher.spool.segment_paths(),
+                    DRAIN_TIMEOUT):
+        errors.append(f"replay delivered {len(stub.events())}/{EVENT_COUNT} events, "
+                      f"{len(dispatcher.spool.segment_paths())} segment(s) left")
+    dispatcher.close()
+
+    events = stub.events()
+    sequence = sorted(event['params']['seq'] for event in events)
+    if sequence != list(range(EVENT_COUNT)):
+        errors.append(f"expected each event exactly once, got {len(events)} events "
+                      f"({len(set(sequence))} unique)")
+    if any(not enqueued_at <= event.get('timestamp_micros', 0) < recovered_at for event in events):
+        errors.append("timestamp_micros not taken at enqueue time")
+    return errors
+
+
+def check_orphan_ack(stub: GA4StubServer, directory: str) -> list:
+    """Osierocony .ack po awarii w trakcie usuwania segmentu nie może ukryć rekordów nowego segmentu"""
+    errors = []
+    stub.set_status(204)
+    first_segment = os.path.join(directory, f'{SEGMENT_PREFIX}{1:010d}{SEGMENT_SUFFIX}')
+    os.makedirs(directory, exist_ok=True)
+    with open(first_segment + ACK_SUFFIX, 'w') as f:
+        f.write('1000000')
+
+    already_received = len(stub.events())
+    dispatcher = make_dispatcher(stub.endpoint, directory)
+    dispatcher.spool.append([{'client_id': 'orphan', 'event': {'name': 'search', 'params': {'seq': i}}}
+                             for i in range(5)])
+    dispatcher.spool.close_segment()
+    dispatcher.start()
+    if not wait_for(lambda: len(stub.events()) - already_received >= 5, DRAIN_TIMEOUT):
+        errors.append(f"stale .ack hid {5 - (len(stub.events()) - already_received)}/5 records of a new segment")
+    dispatcher.close()
+    return errors
+
+
+def check_replayer_survives_errors(stub: GA4StubServer, directory: str) -> list:
+    """Rekord bez pól zdarzenia i nieudany zapis .ack nie zabijają wątku replay"""
+    errors = []
+    stub.set_status(204)
+    already_received = len(stub.events())
+    dispatcher = make_dispatcher(stub.endpoint, directory)
+    dispatcher.spool.append([{'unexpected': 'record'}] +
+                            [{'client_id': 'replay', 'event': {'name': 'search', 'params': {'seq': i}}}
+                             for i in range(5)])
+    dispatcher.spool.close_segment()
+
+    acknowledge = dispatcher.spool.acknowledge
+    failures = []
+
+    def failing_acknowledge(*args):
+        if not failures:
+            failures.append(True)
+            raise OSError('simulated ack write failure')
+        return acknowledge(*args)
+
+    dispatcher.spool.acknowledge = failing_acknowledge
+    dispatcher.start()
+    if not wait_for(lambda: not dispatcher.spool.segment_paths(), DRAIN_TIMEOUT):
+        errors.append(f"segment not drained after errors, replayer alive: {dispatcher.replayer.is_alive()}")
+    elif len(stub.events()) - already_received < 5:
+        errors.append(f"only {len(stub.events()) - already_received}/5 valid records delivered")
+    dispatcher.close()
+    return errors
+
+
+def main() -> int:
+    stub = GA4StubServer().start()
+    failed = False
+    try:
+        for name, check in (('outage and recovery', check_outage_and_recovery),
+                            ('orphan ack', check_orphan_ack),
+                            ('replayer survives errors', check_replayer_survives_errors)):
+            with tempfile.TemporaryDirectory() as directory:
+                errors = check(stub, os.path.join(directory, 'ga4_spool'))
+            if errors:
+                failed = True
+                for error in errors:
+                    print(f"[CHECK] ❌ {name}: {error}")
+            else:
+                print(f"[CHECK] ✅ {name}")
+    finally:
+        stub.stop()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,25 +5,220 @@ System Inteligentnego Śledzenia Utraconego Popytu - NAPRAWIONA KALIBRACJA
 import json
 import os
 import re
+import sys
+import bisect
+import heapq
+import multiprocessing
+import itertools
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
 import time
 import hashlib
 import random
-import requests
 import uuid
 from datetime import datetime
 from flask import session
 from difflib import SequenceMatcher
 from fuzzywuzzy import fuzz, process
-from typing import Tuple, List, Dict, Optional
+from typing import Tuple, List, Dict, Optional, NamedTuple, Sequence
+from search_index import BKTree, PrefixTrie, NgramIndex, FuzzyVocabularyIndex, LRUCache, fold_diacritics
+from vector_scoring import VectorScoringEngine, numpy_available
+from catalog_loader import iter_catalog, current_rss_bytes
+from product_store import ProductStore
+from query_rewrite import QueryRewriter, load_rewrite_rules
+from analytics_dispatch import GA4Dispatcher, GA4_DEFAULT_ENDPOINT, GA4_MAX_EVENTS_PER_REQUEST
+from analytics_spool import EventSpool, CircuitBreaker
+
+# Cache wyników wyszukiwania (popularne prefiksy z autocomplete)
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '2048'))
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '300'))
+
+# Wyniki tokenów zapytań współdzielone między requestami (dopasowania do słownika, validity)
+TOKEN_SCORE_CACHE_SIZE = int(os.getenv('TOKEN_SCORE_CACHE_SIZE', '20000'))
+
+# Stan wyszukiwania przyrostowego (znak po znaku) per sesja
+INCREMENTAL_SESSIONS = int(os.getenv('INCREMENTAL_SESSIONS', '4096'))
+INCREMENTAL_SESSION_TTL = float(os.getenv('INCREMENTAL_SESSION_TTL', '900'))
+
+# Zewnętrzny katalog produktów (JSONL/CSV/SQLite) - pusty = wbudowany katalog demo
+CATALOG_SOURCE = os.getenv('CATALOG_SOURCE', '')
+
+# Co ile sekund sprawdzać zmianę pliku katalogu (0 = obserwacja wyłączona)
+CATALOG_WATCH_INTERVAL = float(os.getenv('CATALOG_WATCH_INTERVAL', '0'))
+
+# Przeładowanie odrzucane gdy odrzucone rekordy przekraczają ten ułamek źródła (uszkodzony/ucięty plik)
+CATALOG_MAX_SKIPPED_RATIO = float(os.getenv('CATALOG_MAX_SKIPPED_RATIO', '0.5'))
+
+# Dodatkowe reguły przepisywania zapytań (plik .tsv/.txt/.json) - uzupełniają wbudowane literówki
+QUERY_REWRITE_RULES = os.getenv('QUERY_REWRITE_RULES', '')
+
+# GA4 Measurement Protocol - zdarzenia wysyłane partiami w tle
+GA4_MEASUREMENT_ID = os.getenv('GA4_MEASUREMENT_ID', 'G-ECOMMERCE123')
+GA4_API_SECRET = os.getenv('GA4_API_SECRET', 'YOUR_API_SECRET_HERE')
+GA4_ENDPOINT = os.getenv('GA4_ENDPOINT', GA4_DEFAULT_ENDPOINT)
+GA4_QUEUE_SIZE = int(os.getenv('GA4_QUEUE_SIZE', '10000'))
+GA4_BATCH_SIZE = int(os.getenv('GA4_BATCH_SIZE', str(GA4_MAX_EVENTS_PER_REQUEST)))
+GA4_FLUSH_INTERVAL = float(os.getenv('GA4_FLUSH_INTERVAL', '0.5'))
+
+# Bufor dyskowy niewysłanych zdarzeń GA4 (pusty katalog = bufor wyłączony) i polityka ponowień
+GA4_SPOOL_DIR = os.getenv('GA4_SPOOL_DIR', 'ga4_spool')
+GA4_SPOOL_SEGMENT_BYTES = int(os.getenv('GA4_SPOOL_SEGMENT_BYTES', str(1 << 20)))
+GA4_RETRY_MAX_DELAY = float(os.getenv('GA4_RETRY_MAX_DELAY', '300'))
+GA4_BREAKER_THRESHOLD = int(os.getenv('GA4_BREAKER_THRESHOLD', '5'))
+GA4_BREAKER_RESET = float(os.getenv('GA4_BREAKER_RESET', '30'))
+
+# Silnik scoringu produktów: 'scalar' (domyślny) albo 'numpy'
+SCORING_ENGINE = os.getenv('SCORING_ENGINE', 'scalar')
+
+# Produkty 'uniwersalny' należą do każdej partycji typu pojazdu
+UNIVERSAL_MACHINE = 'uniwersalny'
+
+# Wzorce klasyfikacji tokenów zapytania (kompilowane raz)
+PRODUCT_CODE_PATTERN = re.compile(r'[A-Z]+\d{2,}|\d{4,}')   # N123, BMW320, 0986494104
+KEYBOARD_PATTERN = re.compile('qwerty|qwertyui|asdf|asdfgh|qwe|asd|zxc|hjkl|uiop')
+REPEATED_SEQUENCE_PATTERN = re.compile(r'(.{2,}?)\1+')     # asdasd, abcabc
+POLISH_VOWELS = frozenset('aeiouąęy')
+
+# Analiza wsadowa - poniżej tej liczby zapytań pula procesów się nie opłaca
+BATCH_MIN_PARALLEL = int(os.getenv('BATCH_MIN_PARALLEL', '500'))
+
+
+class CatalogValidationError(ValueError):
+    """Nowy snapshot katalogu wygląda na uszkodzony - zostaje poprzednia wersja"""
+
+
+class ProductFeatures(NamedTuple):
+    """Prekomputowane cechy produktu używane w pętli scoringu"""
+    tokens: Tuple[str, ...]
+    brand_lower: str
+    model_lower: str
+    category_lower: str
+
+
+class FaqFeatures(NamedTuple):
+    """Prekomputowane pola FAQ używane przy wyszukiwaniu"""
+    question_lower: str
+    keywords_lower: Tuple[str, ...]
+
+
+class TokenFeatures(NamedTuple):
+    """Cechy tokenu zapytania liczone w jednym przebiegu - wspólne dla validity, kodów i nonsensu"""
+    token: str
+    validity: float
+    is_code_candidate: bool
+    looks_like_code: bool
+    has_known_prefix: bool
+    unique_chars: int
+    has_vowel: bool
+    has_keyboard_pattern: bool
+    is_repeated_sequence: bool
+
+
+class SearchPartition(NamedTuple):
+    """Indeksy wyszukiwania dla fragmentu katalogu - całość albo jeden typ pojazdu (+ uniwersalne)"""
+    machine: Optional[str]
+    positions: Optional[List[int]]
+    token_index: Dict[str, List[int]]
+    sorted_vocabulary: List[str]
+    brand_index: Dict[str, List[int]]
+    vector_engine: Optional[VectorScoringEngine]
+    # Dane snapshotu katalogu, z którego pochodzi partycja - zapytanie w toku nie miesza wersji
+    products: Sequence
+    product_features: List[ProductFeatures]
+    fuzzy_vocabulary: FuzzyVocabularyIndex
+    catalog_version: int
+
+
+class CatalogSnapshot(NamedTuple):
+    """Niezmienna wersja katalogu razem z indeksami - podmieniana atomowo przy przeładowaniu"""
+    version: int
+    product_database: Dict
+    product_features: List[ProductFeatures]
+    product_code_index: NgramIndex
+    product_positions: Dict[str, int]
+    search_partitions: Dict[Optional[str], SearchPartition]
+    stats: Dict
+
+
+def catalog_source_mtime(source: str) -> Optional[float]:
+    """Czas modyfikacji pliku źródła katalogu ('plik.db#tabela' -> plik.db)"""
+    try:
+        return os.path.getmtime(source.partition('#')[0])
+    except OSError:
+        return None
+
+
+def eventlet_patched() -> bool:
+    """Czy aplikacja działa na eventlet z podmienionymi wątkami (wsgi.py)"""
+    patcher = sys.modules.get('eventlet.patcher')
+    return patcher is not None and patcher.is_monkey_patched('thread')
+
+
+def run_blocking(func, *args):
+    """Ciężkie obliczenia w prawdziwym wątku, jeśli aplikacja działa na eventlet (hub nie jest blokowany)"""
+    if not eventlet_patched():
+        return func(*args)
+    from eventlet import tpool
+    return tpool.execute(func, *args)
 
 
 class EcommerceBot:
-    def __init__(self):
+    def __init__(self, catalog_source: Optional[str] = None):
+        self.catalog_source = catalog_source if catalog_source is not None else CATALOG_SOURCE
+        self.catalog_stats = {}
         self.product_database = {}
         self.faq_database = {}
         self.orders_database = {}
         self.current_context = None
-        self.search_cache = {}
+        self.search_cache = LRUCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+        
+        # Zdarzenia GA4 - request płaci tylko za wrzucenie do kolejki, wątek wysyłający startuje leniwie
+        # Niewysłane zdarzenia trafiają do bufora dyskowego i są wysyłane ponownie po powrocie endpointu
+        self.ga4_dispatcher = GA4Dispatcher(
+            GA4_MEASUREMENT_ID, GA4_API_SECRET, endpoint=GA4_ENDPOINT, queue_size=GA4_QUEUE_SIZE,
+            batch_size=GA4_BATCH_SIZE, flush_interval=GA4_FLUSH_INTERVAL,
+            spool=EventSpool(GA4_SPOOL_DIR, GA4_SPOOL_SEGMENT_BYTES) if GA4_SPOOL_DIR else None,
+            breaker=CircuitBreaker(GA4_BREAKER_THRESHOLD, GA4_BREAKER_RESET),
+            retry_max_delay=GA4_RETRY_MAX_DELAY
+        )
+        atexit.register(self.ga4_dispatcher.close)
+        
+        # Aktualny snapshot katalogu (atrybuty poniżej to skróty do jego pól)
+        self.catalog = None
+        self.catalog_version = 0
+        self.catalog_versions = itertools.count(1)
+        self.catalog_reload_lock = threading.Lock()
+        self.catalog_reload_status = {'state': 'idle'}
+        self.builtin_database = {}
+        self.incremental_searches = LRUCache(maxsize=INCREMENTAL_SESSIONS, ttl=INCREMENTAL_SESSION_TTL)
+        # Bez TTL - klucze wyników słownikowych zawierają wersję katalogu
+        self.token_score_cache = LRUCache(maxsize=TOKEN_SCORE_CACHE_SIZE, ttl=None)
+        
+        # Indeks odwrócony: token katalogu -> pozycje produktów w product_database['products']
+        self.token_index = {}
+        self.sorted_vocabulary = []
+        self.brand_index = {}
+        self.product_features = []
+        self.product_code_index = NgramIndex()
+        self.product_positions = {}
+        self.scoring_engine = SCORING_ENGINE
+        self.vector_engine = None
+        
+        # Partycje katalogu per typ pojazdu (klucz None = cały katalog)
+        self.search_partitions = {}
+        
+        # Kandydaci fuzzy ze słownika całego katalogu (filtr długości + bigramy)
+        self.fuzzy_vocabulary = FuzzyVocabularyIndex()
+        
+        # Indeks FAQ: pola lowercase + trigramy pytań i słów kluczowych
+        self.faq_features = []
+        self.faq_question_index = NgramIndex()
+        self.faq_keyword_index = NgramIndex()
+        self.faq_folded_question_index = NgramIndex()
+        self.faq_positions_by_question = {}
+        self.faq_positions_by_keyword = {}
+        self.faq_positions_by_folded_question = {}
         
         # === ROZSZERZONE SŁOWNIKI DOMENOWE ===
         self.AUTOMOTIVE_DICTIONARY = {
@@ -94,14 +289,71 @@ class EcommerceBot:
             'sportowe', 'terenowe', 'miejskie', 'szosowe'
         }
         
+        # Podstawowe korekty literówek (całe tokeny - 'golf' nie zawiera już 'gol')
+        self.QUERY_REWRITES = {
+            'kloki': 'klocki',
+            'klocek': 'klocki',
+            'filetr': 'filtr',
+            'amortyztor': 'amortyzator',
+            'swica': 'świeca',
+            'swieca': 'świeca',
+            'gol': 'golf',
+            'vw': 'volkswagen',
+            'mb': 'mercedes',
+            'yam': 'yamaha',
+            'sprin': 'sprinter'
+        }
+        
+        self.build_dictionary_indexes()
         self.initialize_data()
     
+    def get_known_words(self) -> List[str]:
+        """Lista znanych słów używana przy ocenie literówek"""
+        return (
+            self.AUTOMOTIVE_DICTIONARY['brands'] +
+            self.AUTOMOTIVE_DICTIONARY['luxury_brands'] +
+            self.AUTOMOTIVE_DICTIONARY['categories'] +
+            self.AUTOMOTIVE_DICTIONARY['car_models'] +
+            self.AUTOMOTIVE_DICTIONARY['common_terms'] +
+            list(self.POLISH_DICTIONARY)
+        )
+    
+    def build_dictionary_indexes(self):
+        """Buduje indeksy nad słownikami domenowymi (raz, przy starcie bota)"""
+        # Słowo -> waga validity; przy słowie w kilku klasach wygrywa klasa o wyższej wadze
+        self.dictionary_scores = {}
+        for dictionary_class, score in (('brands', 100), ('luxury_brands', 95), ('categories', 90),
+                                        ('car_models', 85), ('motorcycle_terms', 80), ('common_terms', 70)):
+            for word in self.AUTOMOTIVE_DICTIONARY[dictionary_class]:
+                self.dictionary_scores.setdefault(word, score)
+        
+        # Wzorce modeli jako jedno skompilowane wyrażenie
+        self.model_code_pattern = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in self.AUTOMOTIVE_DICTIONARY['model_codes'])
+        )
+        
+        # Reguły przepisywania zapytań: wbudowane + opcjonalny plik (plik nadpisuje wbudowane)
+        self.query_rewriter = QueryRewriter.from_mapping(self.QUERY_REWRITES)
+        if QUERY_REWRITE_RULES:
+            self.query_rewriter.update(load_rewrite_rules(QUERY_REWRITE_RULES))
+            print(f"[REWRITE] Loaded {len(self.query_rewriter)} query rewrite rules ({QUERY_REWRITE_RULES})")
+        
+        # BK-tree - najbliższe znane słowo bez skanowania całego słownika
+        self.known_words_tree = BKTree(self.get_known_words())
+        
+        # Trie prefiksów - formy oryginalne i bez polskich znaków
+        self.known_prefix_trie = PrefixTrie()
+        for known_word in self.get_known_words():
+            self.known_prefix_trie.add(known_word)
+            self.known_prefix_trie.add(fold_diacritics(known_word))
+    
     def initialize_data(self):
         """Inicjalizuje kompletną bazę danych dla branży motoryzacyjnej"""
         
         # Rozszerzona baza 70+ produktów
-        self.product_database = {
-            'products': [
+        self.builtin_database = {
+            # Kolumnowy magazyn - widoki produktów zachowują dostęp jak do słownika
+            'products': ProductStore([
                 # === SAMOCHODY OSOBOWE - KLOCKI HAMULCOWE ===
                 {'id': 'KH001', 'name': 'Klocki hamulcowe przód Bosch BMW E90 320i', 'category': 'hamulce', 'machine': 'osobowy', 'brand': 'Bosch', 'model': '0986494104', 'price': 189.00, 'stock': 45},
                 {'id': 'KH002', 'name': 'Klocki hamulcowe tył ATE Mercedes W204 C200', 'category': 'hamulce', 'machine': 'osobowy', 'brand': 'ATE', 'model': '13.0460-7218', 'price': 156.00, 'stock': 38},
@@ -151,7 +403,7 @@ class EcommerceBot:
                 # === SAMOCHODY DOSTAWCZE ===
                 {'id': 'DKH001', 'name': 'Klocki hamulcowe Textar Mercedes Sprinter 906 przód', 'category': 'hamulce', 'machine': 'dostawczy', 'brand': 'Textar', 'model': '2430801', 'price': 267.00, 'stock': 34},
                 {'id': 'DFO001', 'name': 'Filtr oleju Mann W712/94 Sprinter Vito 2.2 CDI', 'category': 'filtry', 'machine': 'dostawczy', 'brand': 'Mann', 'model': 'W712/94', 'price': 78.00, 'stock': 89}
-            ],
+            ]),
             'categories': {
                 'hamulce': '🔧 Układ hamulcowy',
                 'filtry': '🔍 Filtry',
@@ -277,71 +529,564 @@ class EcommerceBot:
                 'items': ['Klocki hamulcowe Bosch BMW E90']
             }
         }
+        
+        self.build_faq_index()
+        
+        if self.catalog_source:
+            self.load_catalog(self.catalog_source)
+        else:
+            self.build_search_index()
     
-    def calculate_token_validity(self, query_tokens: List[str]) -> float:
-        """NAPRAWIONA funkcja - oblicza wskaźnik poprawności tokenów (0-100)"""
-        if not query_tokens:
-            return 0
+    def build_faq_index(self):
+        """Prekomputuje pola FAQ i indeksy trigramów (pytania, słowa kluczowe)"""
+        self.faq_features = []
+        self.faq_question_index = NgramIndex()
+        self.faq_keyword_index = NgramIndex()
+        self.faq_folded_question_index = NgramIndex()
+        self.faq_positions_by_question = {}
+        self.faq_positions_by_keyword = {}
+        self.faq_positions_by_folded_question = {}
+        
+        for position, faq in enumerate(self.faq_database):
+            features = FaqFeatures(
+                question_lower=faq['question'].lower(),
+                keywords_lower=tuple(k.lower() for k in faq['keywords'])
+            )
+            self.faq_features.append(features)
+            
+            self.faq_question_index.add(features.question_lower)
+            self.faq_positions_by_question.setdefault(features.question_lower, []).append(position)
+            # Pytania bez polskich znaków - filtr fuzzy dla zapytań pisanych bez ogonków ("czesci")
+            folded_question = fold_diacritics(features.question_lower)
+            self.faq_folded_question_index.add(folded_question)
+            self.faq_positions_by_folded_question.setdefault(folded_question, []).append(position)
+            for keyword in dict.fromkeys(features.keywords_lower):
+                self.faq_keyword_index.add(keyword)
+                self.faq_positions_by_keyword.setdefault(keyword, []).append(position)
+    
+    def build_product_features(self, product: Dict) -> ProductFeatures:
+        """Tokenizuje produkt raz przy ładowaniu katalogu"""
+        product_text = f"{product['name']} {product['brand']} {product['model']} {product['category']}"
+        # Duplikaty nie zmieniają maksimum per token - zostawiamy pierwsze wystąpienie
+        # Internowanie - jeden obiekt str na token/markę/kategorię w całym katalogu
+        tokens = tuple(sys.intern(token) for token in dict.fromkeys(product_text.lower().split()))
+        return ProductFeatures(
+            tokens=tokens,
+            brand_lower=sys.intern(product['brand'].lower()),
+            model_lower=product['model'].lower(),
+            category_lower=sys.intern(product['category'].lower())
+        )
+    
+    def new_search_index(self) -> Dict:
+        """Pusty stan budowanych indeksów katalogu"""
+        return {
+            'token_index': {},
+            'brand_index': {},
+            'product_features': [],
+            'product_code_index': NgramIndex(),
+            'product_positions': {},
+            'machine_positions': {},
+            'machine_token_index': {},
+            'machine_brand_index': {}
+        }
+    
+    def index_product(self, index: Dict, product: Dict):
+        """Dodaje produkt do budowanych indeksów (pozycja = kolejny numer w katalogu)"""
+        position = len(index['product_features'])
+        features = self.build_product_features(product)
+        index['product_features'].append(features)
+        # Przy zdublowanym ID wygrywa pierwszy produkt (jak przy przeszukiwaniu listy)
+        index['product_positions'].setdefault(product['id'], position)
+        
+        machine = product['machine']
+        machine_token_index = index['machine_token_index'].setdefault(machine, {})
+        index['machine_positions'].setdefault(machine, []).append(position)
+        
+        for token in features.tokens:
+            index['token_index'].setdefault(token, []).append(position)
+            machine_token_index.setdefault(token, []).append(position)
+        # Pusta marka zawiera się w każdym zapytaniu - nie może dawać kandydatów ani bonusu
+        if features.brand_lower:
+            index['brand_index'].setdefault(features.brand_lower, []).append(position)
+            index['machine_brand_index'].setdefault(machine, {}).setdefault(features.brand_lower, []).append(position)
+        
+        # Pola w których szukamy kodów produktów (model, id, nazwa)
+        product_code_index = index['product_code_index']
+        product_code_index.add(product['model'].upper())
+        product_code_index.add(product['id'])
+        product_code_index.add(product['name'].upper())
+    
+    def build_catalog_snapshot(self, product_database: Dict, index: Dict, stats: Dict) -> CatalogSnapshot:
+        """Składa snapshot katalogu z gotowych indeksów (bez zmiany stanu bota)"""
+        version = next(self.catalog_versions)
+        return CatalogSnapshot(
+            version=version,
+            product_database=product_database,
+            product_features=index['product_features'],
+            product_code_index=index['product_code_index'],
+            product_positions=index['product_positions'],
+            search_partitions=self.build_search_partitions(index, product_database['products'], version),
+            stats=dict(stats, version=version)
+        )
+    
+    def install_catalog(self, snapshot: CatalogSnapshot):
+        """Atomowo podmienia snapshot katalogu - zapytania w toku kończą na poprzednim
+        
+        Klucze cache zawierają wersję katalogu, więc stare wpisy przestają trafiać same;
+        czyszczenie tylko zwalnia pamięć.
+        """
+        self.catalog = snapshot
+        
+        # Skróty do pól snapshotu (ścieżki poza wyszukiwaniem: karta produktu, koszyk, raporty)
+        self.product_database = snapshot.product_database
+        self.product_features = snapshot.product_features
+        self.product_code_index = snapshot.product_code_index
+        self.product_positions = snapshot.product_positions
+        self.search_partitions = snapshot.search_partitions
+        full_catalog = snapshot.search_partitions[None]
+        self.token_index = full_catalog.token_index
+        self.sorted_vocabulary = full_catalog.sorted_vocabulary
+        self.brand_index = full_catalog.brand_index
+        self.vector_engine = full_catalog.vector_engine
+        self.fuzzy_vocabulary = full_catalog.fuzzy_vocabulary
+        self.catalog_stats = snapshot.stats
+        self.catalog_version = snapshot.version
+        
+        self.search_cache.clear()
+        self.token_score_cache.clear()
+    
+    def merge_postings(self, primary: Dict[str, List[int]], extra: Dict[str, List[int]]) -> Dict[str, List[int]]:
+        """Łączy dwa indeksy token -> pozycje (listy pozycji pozostają posortowane)"""
+        merged = dict(primary)
+        for token, positions in extra.items():
+            if token in merged:
+                merged[token] = sorted(merged[token] + positions)
+            else:
+                merged[token] = positions
+        return merged
+    
+    def build_search_partition(self, template: SearchPartition, machine: Optional[str],
+                               positions: Optional[List[int]], token_index: Dict, brand_index: Dict,
+                               use_vector: bool) -> SearchPartition:
+        """Tworzy partycję wyszukiwania (z silnikiem wektorowym jeśli włączony)"""
+        sorted_vocabulary = sorted(token_index)
+        vector_engine = None
+        if use_vector:
+            vector_engine = self.build_vector_engine(template.product_features, sorted_vocabulary, positions)
+        return template._replace(
+            machine=machine,
+            positions=positions,
+            token_index=token_index,
+            sorted_vocabulary=sorted_vocabulary,
+            brand_index=brand_index,
+            vector_engine=vector_engine
+        )
+    
+    def build_search_partitions(self, index: Dict, products: Sequence,
+                                version: int) -> Dict[Optional[str], SearchPartition]:
+        """Partycjonuje indeksy po typie pojazdu - produkty uniwersalne trafiają do każdej partycji"""
+        use_vector = self.scoring_engine == 'numpy' and numpy_available()
+        if self.scoring_engine == 'numpy' and not use_vector:
+            print("[SEARCH] NumPy not installed - falling back to scalar scoring engine")
+        
+        # Wspólne pola partycji snapshotu; próg 70 = najniższy próg fuzzy w score_query_token
+        template = SearchPartition(
+            machine=None,
+            positions=None,
+            token_index={},
+            sorted_vocabulary=[],
+            brand_index={},
+            vector_engine=None,
+            products=products,
+            product_features=index['product_features'],
+            fuzzy_vocabulary=FuzzyVocabularyIndex(sorted(index['token_index']), min_ratio=70),
+            catalog_version=version
+        )
+        
+        partitions = {
+            None: self.build_search_partition(
+                template, None, None, index['token_index'], index['brand_index'], use_vector)
+        }
         
-        validity_scores = []
+        universal_positions = index['machine_positions'].get(UNIVERSAL_MACHINE, [])
+        universal_tokens = index['machine_token_index'].get(UNIVERSAL_MACHINE, {})
+        universal_brands = index['machine_brand_index'].get(UNIVERSAL_MACHINE, {})
         
-        for token in query_tokens:
-            token_lower = token.lower()
-            score = 0
+        for machine, positions in index['machine_positions'].items():
+            if machine == UNIVERSAL_MACHINE:
+                continue
+            partitions[machine] = self.build_search_partition(
+                template,
+                machine,
+                sorted(positions + universal_positions),
+                self.merge_postings(index['machine_token_index'][machine], universal_tokens),
+                self.merge_postings(index['machine_brand_index'][machine], universal_brands),
+                use_vector
+            )
+        
+        # Filtr bez własnych produktów (np. sam 'uniwersalny') widzi tylko produkty uniwersalne
+        partitions[UNIVERSAL_MACHINE] = self.build_search_partition(
+            template, UNIVERSAL_MACHINE, universal_positions, universal_tokens, universal_brands, use_vector
+        )
+        
+        return partitions
+    
+    def get_search_partition(self, machine_filter: Optional[str] = None) -> SearchPartition:
+        """Partycja dla filtra typu pojazdu z sesji (z aktualnego snapshotu katalogu)"""
+        search_partitions = self.catalog.search_partitions
+        if not machine_filter:
+            return search_partitions[None]
+        partition = search_partitions.get(machine_filter)
+        if partition is None:
+            partition = search_partitions[UNIVERSAL_MACHINE]
+        return partition
+    
+    def build_builtin_snapshot(self) -> CatalogSnapshot:
+        """Snapshot wbudowanego katalogu demo"""
+        product_database = self.builtin_database
+        index = self.new_search_index()
+        for product in product_database['products']:
+            self.index_product(index, product)
+        stats = {
+            'source': 'builtin',
+            'products': len(product_database['products'])
+        }
+        return self.build_catalog_snapshot(product_database, index, stats)
+    
+    def build_search_index(self):
+        """Buduje tabelę cech produktów, indeks odwrócony token -> produkty i posortowany słownik prefiksów"""
+        self.install_catalog(self.build_builtin_snapshot())
+    
+    def build_source_snapshot(self, source: str) -> CatalogSnapshot:
+        """Strumieniowo czyta katalog (JSONL/CSV/SQLite) i buduje wszystkie indeksy w jednym przebiegu"""
+        started = time.time()
+        rss_before = current_rss_bytes()
+        load_stats = {'skipped': 0}
+        
+        products = ProductStore()
+        index = self.new_search_index()
+        categories = dict(self.builtin_database.get('categories', {}))
+        
+        for product in iter_catalog(source, load_stats):
+            products.append(product)
+            self.index_product(index, product)
+            categories.setdefault(product['category'], product['category'])
+        
+        product_database = dict(self.builtin_database, products=products, categories=categories)
+        stats = {
+            'source': source,
+            'products': len(products),
+            'skipped': load_stats['skipped'],
+            'vocabulary': len(index['token_index']),
+            'store_bytes_per_product': products.memory_usage()['bytes_per_product'],
+            'source_mtime': catalog_source_mtime(source)
+        }
+        snapshot = self.build_catalog_snapshot(product_database, index, stats)
+        
+        rss_after = current_rss_bytes()
+        snapshot.stats.update(
+            load_seconds=round(time.time() - started, 3),
+            rss_mb=round(rss_after / 1048576, 1) if rss_after else None,
+            rss_delta_mb=round((rss_after - rss_before) / 1048576, 1) if rss_after and rss_before else None
+        )
+        return snapshot
+    
+    def load_catalog(self, source: str) -> Dict:
+        """Ładuje katalog ze źródła i podpina go pod bota"""
+        snapshot = self.build_source_snapshot(source)
+        self.install_catalog(snapshot)
+        
+        stats = snapshot.stats
+        print(f"[CATALOG] Loaded {stats['products']} products from {source} "
+              f"in {stats['load_seconds']}s "
+              f"(skipped: {stats['skipped']}, RSS +{stats['rss_delta_mb']} MB)")
+        
+        return stats
+    
+    def validate_catalog_snapshot(self, snapshot: CatalogSnapshot):
+        """Odrzuca pusty katalog i katalog z dużą częścią odrzuconych rekordów (CatalogValidationError)"""
+        products = snapshot.stats.get('products', 0)
+        skipped = snapshot.stats.get('skipped', 0)
+        
+        if products == 0:
+            raise CatalogValidationError(f'New catalog has no products (skipped: {skipped})')
+        
+        skipped_ratio = skipped / (products + skipped)
+        if skipped_ratio > CATALOG_MAX_SKIPPED_RATIO:
+            raise CatalogValidationError(
+                f'New catalog skipped {skipped} of {products + skipped} records '
+                f'({skipped_ratio:.0%} > {CATALOG_MAX_SKIPPED_RATIO:.0%})'
+            )
+    
+    def reload_catalog(self, source: Optional[str] = None) -> Dict:
+        """Przeładowanie na gorąco: nowy snapshot budowany obok starego i podmieniany atomowo
+        
+        source - nowe źródło katalogu (domyślnie aktualne); bez źródła przebudowuje katalog wbudowany
+        """
+        if not self.catalog_reload_lock.acquire(blocking=False):
+            raise RuntimeError('Catalog reload already in progress')
+        
+        source = source or self.catalog_source
+        started_at = datetime.now().isoformat()
+        try:
+            self.catalog_reload_status = {'state': 'running', 'source': source or 'builtin', 'started_at': started_at}
             
-            # Sprawdź w słowniku marek zwykłych (waga 100)
-            if token_lower in self.AUTOMOTIVE_DICTIONARY['brands']:
-                score = 100
-            # Sprawdź marki luksusowe (waga 95) - WAŻNE DLA FERRARI!
-            elif token_lower in self.AUTOMOTIVE_DICTIONARY['luxury_brands']:
-                score = 95
-            # Sprawdź w słowniku kategorii (waga 90)
-            elif token_lower in self.AUTOMOTIVE_DICTIONARY['categories']:
-                score = 90
-            # Sprawdź modele samochodów (waga 85)
-            elif token_lower in self.AUTOMOTIVE_DICTIONARY['car_models']:
-                score = 85
-            # Sprawdź terminy motocyklowe (waga 80)
-            elif token_lower in self.AUTOMOTIVE_DICTIONARY['motorcycle_terms']:
-                score = 80
-            # Sprawdź w common terms (waga 70)
-            elif token_lower in self.AUTOMOTIVE_DICTIONARY['common_terms']:
-                score = 70
-            # Sprawdź czy pasuje do wzorca modelu (waga 60)
-            elif any(re.match(pattern, token.upper()) for pattern in self.AUTOMOTIVE_DICTIONARY['model_codes']):
-                score = 60
-            # Sprawdź czy to prawidłowe polskie słowo (waga 50)
-            elif token_lower in self.POLISH_DICTIONARY:
-                score = 50
-            # Sprawdź minimalną odległość do znanych słów
+            if source:
+                snapshot = run_blocking(self.build_source_snapshot, source)
             else:
-                min_distance = float('inf')
-                all_known_words = (
-                    self.AUTOMOTIVE_DICTIONARY['brands'] +
-                    self.AUTOMOTIVE_DICTIONARY['luxury_brands'] +
-                    self.AUTOMOTIVE_DICTIONARY['categories'] +
-                    self.AUTOMOTIVE_DICTIONARY['car_models'] +
-                    self.AUTOMOTIVE_DICTIONARY['common_terms'] +
-                    list(self.POLISH_DICTIONARY)
-                )
-                
-                for known_word in all_known_words:
-                    distance = self.levenshtein_distance(token_lower, known_word)
-                    if distance < min_distance:
-                        min_distance = distance
-                
-                # Jeśli odległość <= 2, to prawdopodobnie literówka
-                if min_distance <= 1:
-                    score = 60
-                elif min_distance <= 2:
-                    score = 40
-                elif min_distance <= 3:
-                    score = 20
-                else:
-                    score = 0
+                snapshot = run_blocking(self.build_builtin_snapshot)
+            
+            # Ucięty albo zły plik nie może podmienić działającego katalogu
+            self.validate_catalog_snapshot(snapshot)
+            
+            previous_version = self.catalog_version
+            self.install_catalog(snapshot)
+            self.catalog_source = source
+            
+            self.catalog_reload_status = {
+                'state': 'done',
+                'source': source or 'builtin',
+                'started_at': started_at,
+                'finished_at': datetime.now().isoformat(),
+                'previous_version': previous_version,
+                'version': snapshot.version
+            }
+            print(f"[CATALOG] Reloaded {snapshot.stats['products']} products from {source or 'builtin'} "
+                  f"(version {previous_version} -> {snapshot.version})")
+            return snapshot.stats
+        
+        except Exception as e:
+            self.catalog_reload_status = {
+                'state': 'failed',
+                'source': source or 'builtin',
+                'started_at': started_at,
+                'finished_at': datetime.now().isoformat(),
+                'error': str(e)
+            }
+            print(f"[CATALOG] Reload failed, keeping version {self.catalog_version}: {e}")
+            raise
+        
+        finally:
+            self.catalog_reload_lock.release()
+    
+    def start_catalog_reload(self, source: Optional[str] = None) -> bool:
+        """Uruchamia przeładowanie katalogu w tle (False = przeładowanie już trwa)"""
+        if self.catalog_reload_lock.locked():
+            return False
+        
+        def reload_in_background():
+            try:
+                self.reload_catalog(source)
+            except Exception:
+                pass  # Status i log zapisuje reload_catalog
+        
+        threading.Thread(target=reload_in_background, daemon=True).start()
+        return True
+    
+    def watch_catalog_source(self, interval: float):
+        """Pętla obserwująca plik katalogu - zmiana mtime uruchamia przeładowanie"""
+        last_mtime = self.catalog_stats.get('source_mtime')
+        print(f"[CATALOG] Watching {self.catalog_source} every {interval}s")
+        
+        while True:
+            time.sleep(interval)
+            mtime = catalog_source_mtime(self.catalog_source) if self.catalog_source else None
+            if mtime is None or mtime == last_mtime:
+                continue
+            
+            # Plik w trakcie zapisu - czekamy aż mtime się ustabilizuje
+            time.sleep(min(interval, 1.0))
+            if catalog_source_mtime(self.catalog_source) != mtime:
+                continue
+            
+            last_mtime = mtime
+            try:
+                self.reload_catalog()
+            except Exception:
+                pass  # Status i log zapisuje reload_catalog
+    
+    def start_catalog_watcher(self, interval: float = CATALOG_WATCH_INTERVAL) -> bool:
+        """Uruchamia obserwację pliku katalogu w tle (tylko dla katalogu z pliku i interval > 0)"""
+        if interval <= 0 or not self.catalog_source:
+            return False
+        threading.Thread(target=self.watch_catalog_source, args=(interval,), daemon=True).start()
+        return True
+    
+    def build_vector_engine(self, product_features: List[ProductFeatures], vocabulary: List[str],
+                            positions: Optional[List[int]] = None) -> VectorScoringEngine:
+        """Buduje wektorowy silnik scoringu nad katalogiem (albo podzbiorem pozycji)"""
+        return VectorScoringEngine(product_features, vocabulary, positions)
+    
+    def get_product(self, product_id: str) -> Optional[Dict]:
+        """Produkt po ID w O(1) (None jeśli nie istnieje)"""
+        catalog = self.catalog
+        position = catalog.product_positions.get(product_id)
+        if position is None:
+            return None
+        return catalog.product_database['products'][position]
+    
+    def get_products(self, product_ids: List[str]) -> List[Dict]:
+        """Produkty dla listy ID w tej samej kolejności (np. zawartość koszyka) - nieznane ID są pomijane"""
+        catalog = self.catalog
+        products = catalog.product_database['products']
+        product_positions = catalog.product_positions
+        return [
+            products[product_positions[product_id]]
+            for product_id in product_ids
+            if product_id in product_positions
+        ]
+    
+    def product_code_exists(self, code: str) -> bool:
+        """Sprawdza czy kod występuje w modelu, id lub nazwie któregokolwiek produktu"""
+        return self.product_code_index.contains(code.upper())
+    
+    def score_query_token(self, q_token: str, previous_scores: Optional[Dict[str, float]] = None,
+                          partition: Optional[SearchPartition] = None) -> Dict[str, float]:
+        """Ocenia token zapytania względem słownika katalogu - ta sama punktacja co w pętli per produkt
+        
+        partition - partycja typu pojazdu (domyślnie cały katalog)
+        previous_scores - wyniki tokenu, który jest prefiksem q_token (min. 2 znaki) z poprzedniego
+        zapytania tej sesji. Dopasowania dokładne, prefiksowe i suffiksowe wydłużonego tokenu są
+        podzbiorem tamtych, więc wystarczy je przefiltrować zamiast przeszukiwać słownik.
+        """
+        if partition is None:
+            partition = self.get_search_partition()
+        token_index = partition.token_index
+        scores = {}
+        
+        if previous_scores is not None:
+            for p_token in previous_scores:
+                if q_token == p_token:
+                    scores[p_token] = 100
+                elif p_token.startswith(q_token):
+                    match_ratio = len(q_token) / len(p_token)
+                    scores[p_token] = 95 * match_ratio
+                elif q_token.startswith(p_token) and len(p_token) >= 2:
+                    match_ratio = len(p_token) / len(q_token)
+                    scores[p_token] = 90 * match_ratio
+        else:
+            # Dokładne dopasowanie = 100%
+            if q_token in token_index:
+                scores[q_token] = 100
+            
+            # Prefix match (np. "gol" -> "golf") - zakres w posortowanym słowniku
+            if len(q_token) >= 2:
+                vocabulary = partition.sorted_vocabulary
+                i = bisect.bisect_left(vocabulary, q_token)
+                while i < len(vocabulary) and vocabulary[i].startswith(q_token):
+                    p_token = vocabulary[i]
+                    if p_token != q_token:
+                        match_ratio = len(q_token) / len(p_token)
+                        scores[p_token] = 95 * match_ratio
+                    i += 1
+            
+            # Suffix match - tokeny katalogu będące prefiksem zapytania
+            for end in range(2, len(q_token)):
+                p_token = q_token[:end]
+                if p_token in token_index:
+                    match_ratio = len(p_token) / len(q_token)
+                    scores[p_token] = 90 * match_ratio
+        
+        # Fuzzy match - tylko kandydaci z indeksu bigramów (koszt zależy od słownika, nie katalogu)
+        for p_token in partition.fuzzy_vocabulary.candidates(q_token):
+            if p_token in scores or p_token not in token_index:
+                continue
+            similarity = fuzz.ratio(q_token, p_token)
+            if similarity > 80:
+                scores[p_token] = similarity * 0.95
+            elif similarity > 70:
+                scores[p_token] = similarity * 0.85
+        
+        return scores
+    
+    def dictionary_validity(self, token: str) -> float:
+        """Waga tokenu wg słowników domenowych (0-100)"""
+        token_lower = token.lower()
+        
+        # Marki (100), marki luksusowe (95), kategorie (90), modele (85), motocykle (80), common terms (70)
+        score = self.dictionary_scores.get(token_lower)
+        if score is not None:
+            return score
+        
+        # Sprawdź czy pasuje do wzorca modelu (waga 60)
+        if self.model_code_pattern.match(token.upper()):
+            return 60
+        
+        # Sprawdź czy to prawidłowe polskie słowo (waga 50)
+        if token_lower in self.POLISH_DICTIONARY:
+            return 50
+        
+        # Sprawdź minimalną odległość do znanych słów
+        min_distance = self.known_words_tree.nearest_distance(token_lower, 3)
+        
+        # Jeśli odległość <= 2, to prawdopodobnie literówka
+        if min_distance is None:
+            return 0
+        elif min_distance <= 1:
+            return 60
+        elif min_distance <= 2:
+            return 40
+        return 20
+    
+    def classify_token(self, token: str) -> TokenFeatures:
+        """Jeden przebieg po tokenie: klasa słownikowa, wygląd kodu, prefiks, samogłoski i różnorodność znaków"""
+        token_lower = token.lower()
+        has_digit = any(c.isdigit() for c in token)
+        
+        return TokenFeatures(
+            token=token,
+            validity=self.dictionary_validity(token),
+            # Kod produktu do sprawdzenia w katalogu (N123, E90, 0986494104) - ale nie okrągła liczba
+            is_code_candidate=(PRODUCT_CODE_PATTERN.match(token.upper()) is not None or
+                               (len(token) >= 3 and has_digit and token_lower not in ('100', '200', '300'))),
+            # Litery + cyfry (min 3 znaki) albo kod numeryczny (min 4 cyfry) - nigdy nonsens
+            looks_like_code=((len(token) >= 3 and has_digit and any(c.isalpha() for c in token)) or
+                             (len(token) >= 4 and token.isdigit())),
+            has_known_prefix=(self.known_prefix_trie.has_prefix(token_lower) or
+                              self.known_prefix_trie.has_prefix(fold_diacritics(token_lower))),
+            unique_chars=len(set(token_lower)),
+            has_vowel=any(c in POLISH_VOWELS for c in token_lower),
+            has_keyboard_pattern=KEYBOARD_PATTERN.search(token_lower) is not None,
+            is_repeated_sequence=REPEATED_SEQUENCE_PATTERN.fullmatch(token_lower) is not None
+        )
+    
+    def classify_tokens(self, query_tokens: List[str], memo: Optional[Dict] = None) -> List[TokenFeatures]:
+        """Cechy wszystkich tokenów zapytania (cache między requestami, memo w analizie wsadowej)"""
+        token_features = []
+        for token in query_tokens:
+            if memo is not None and token in memo:
+                token_features.append(memo[token])
+                continue
+            
+            # Cechy zależą tylko od słowników - klucz bez wersji katalogu
+            cache_key = ('token_features', token)
+            features = self.token_score_cache.get(cache_key)
+            if features is None:
+                features = self.classify_token(token)
+                if memo is None:
+                    # Analiza wsadowa tylko czyta z cache (bez wypychania ruchu na żywo)
+                    self.token_score_cache.put(cache_key, features)
             
-            validity_scores.append(score)
+            if memo is not None:
+                memo[token] = features
+            token_features.append(features)
         
+        return token_features
+    
+    def calculate_token_validity(self, query_tokens: List[str], memo: Optional[Dict] = None,
+                                 token_features: Optional[List[TokenFeatures]] = None) -> float:
+        """NAPRAWIONA funkcja - oblicza wskaźnik poprawności tokenów (0-100)
+        
+        memo - opcjonalny słownik token -> cechy współdzielony między zapytaniami (analiza wsadowa)
+        token_features - cechy już policzone przez classify_tokens
+        """
+        if not query_tokens:
+            return 0
+        
+        if token_features is None:
+            token_features = self.classify_tokens(query_tokens, memo)
+        
+        validity_scores = [features.validity for features in token_features]
         return sum(validity_scores) / len(validity_scores)
     
     def levenshtein_distance(self, s1: str, s2: str) -> int:
@@ -371,90 +1116,87 @@ class EcommerceBot:
     
     
     
-    def is_obvious_nonsense(self, tokens: List[str], token_validity: float) -> bool:
-        """NAPRAWIONA - Wykrywa oczywisty nonsens ale pozwala na prefiksy słów"""
+    def is_obvious_nonsense(self, tokens: List[str], token_validity: float,
+                            token_features: Optional[List[TokenFeatures]] = None) -> bool:
+        """NAPRAWIONA - Wykrywa oczywisty nonsens ale pozwala na prefiksy słów
         
-        # NOWE: Sprawdź czy zawiera potencjalne kody produktów
-        for token in tokens:
-            # Wzorce kodów produktów (litery + cyfry, min 3 znaki)
-            if (len(token) >= 3 and 
-                any(c.isdigit() for c in token) and 
-                any(c.isalpha() for c in token)):
-                return False  # To może być kod produktu, nie nonsens
-            
-            # Tylko cyfry, min 4 znaki (kody numeryczne)
-            if len(token) >= 4 and token.isdigit():
-                return False  # To może być kod numeryczny
+        token_features - cechy już policzone przez classify_tokens
+        """
+        if token_features is None:
+            token_features = self.classify_tokens(tokens)
+        
+        # NOWE: Kody produktów (litery + cyfry, min 3 znaki) i kody numeryczne (min 4 cyfry) to nie nonsens
+        if any(features.looks_like_code for features in token_features):
+            return False
         
         # Wielosłowne zapytania rzadko są nonsensem
         if len(tokens) != 1:
             return False
-            
-        token = tokens[0].lower()
+        
+        features = token_features[0]
+        token_length = len(features.token)
         
         # ZMIENIONE: Podstawowe filtry długości - bardziej permisywne
-        if len(token) < 2 or len(token) > 25:
+        if token_length < 2 or token_length > 25:
             return True
         
-        # NOWE: Sprawdź czy token może być prefiksem znanego słowa automotive
-        all_known_words = (
-            self.AUTOMOTIVE_DICTIONARY['brands'] +
-            self.AUTOMOTIVE_DICTIONARY['luxury_brands'] +
-            self.AUTOMOTIVE_DICTIONARY['categories'] +
-            self.AUTOMOTIVE_DICTIONARY['car_models'] +
-            self.AUTOMOTIVE_DICTIONARY['common_terms'] +
-            list(self.POLISH_DICTIONARY)
-        )
-        
-        # Jeśli token jest prefiksem jakiegokolwiek znanego słowa - NIE jest nonsensem
-        for known_word in all_known_words:
-            # Normalizacja polskich znaków
-            token_norm = token.replace('ł', 'l').replace('ć', 'c').replace('ń', 'n').replace('ą', 'a').replace('ę', 'e').replace('ś', 's').replace('ż', 'z').replace('ź', 'z')
-            known_norm = known_word.replace('ł', 'l').replace('ć', 'c').replace('ń', 'n').replace('ą', 'a').replace('ę', 'e').replace('ś', 's').replace('ż', 'z').replace('ź', 'z')
-            
-            if (known_word.startswith(token) or known_norm.startswith(token_norm)) and len(token) >= 2:
-                return False  # To może być prefix, pozwól na dalsze przetwarzanie
+        # NOWE: Jeśli token jest prefiksem jakiegokolwiek znanego słowa - NIE jest nonsensem
+        if features.has_known_prefix:
+            return False  # To może być prefix, pozwól na dalsze przetwarzanie
         
         # ZMIENIONE: Bardzo krótkie tokeny - tylko jeśli bardzo niska validacja
-        if len(token) <= 3 and token_validity < 10:  # Zmienione z 20 na 10
+        if token_length <= 3 and token_validity < 10:  # Zmienione z 20 na 10
             return True
         
         # Oczywiste wzorce klawiaturowe
-        keyboard_patterns = ['qwerty', 'qwertyui', 'asdf', 'asdfgh', 'qwe', 'asd', 'zxc', 'hjkl', 'uiop']
-        if any(pattern in token for pattern in keyboard_patterns):
+        if features.has_keyboard_pattern:
             return True
         
         # Powtarzające się sekwencje (asdasd, abcabc) - bez zmian
-        if len(token) >= 6:
-            for i in range(2, len(token)//2 + 1):
-                pattern = token[:i]
-                if token == pattern * (len(token)//i) and len(token) >= i*2:
-                    return True
+        if token_length >= 6 and features.is_repeated_sequence:
+            return True
         
         # Bardzo mała różnorodność znaków w długim słowie
-        unique_chars = len(set(token))
-        if len(token) > 6 and unique_chars <= 3:
+        if token_length > 6 and features.unique_chars <= 3:
             return True
-            
+        
         # ZMIENIONE: Brak samogłosek - bardziej permisywne
-        polish_vowels = set('aeiouąęy')
-        if len(token) > 6 and not any(c in polish_vowels for c in token):  # Zmienione z 5 na 6
+        if token_length > 6 and not features.has_vowel:  # Zmienione z 5 na 6
             return True
         
         # ZMIENIONE: Kombinacja niskiej entropii i niskiej valid - bardziej permisywne
-        unique_ratio = unique_chars / len(token) if len(token) > 0 else 0
+        unique_ratio = features.unique_chars / token_length
         if unique_ratio < 0.3 and token_validity < 25:  # Zmienione z 0.4 i 35
             return True
-            
+        
         return False
 
-    def analyze_query_intent(self, query: str) -> Dict:
-        """FINALNA WERSJA - Analizuje intencję z wykrywaniem kodów produktów"""
+    def analyze_query_intent(self, query: str, machine_filter: Optional[str] = None,
+                             search_session: Optional[str] = None,
+                             verbose: bool = True, use_cache: bool = True,
+                             memo: Optional[Dict] = None, limit: int = 6) -> Dict:
+        """FINALNA WERSJA - Analizuje intencję z wykrywaniem kodów produktów
+        
+        machine_filter - typ pojazdu z sesji; klasyfikacja liczona tylko na produktach tego typu
+        limit - liczba najlepszych dopasowań w analizie (top-k, reszta katalogu nie jest sortowana)
+        memo - współdzielone wyniki tokenów dla analizy wsadowej (patrz analyze_batch)
+        """
         query_lower = query.lower().strip()
+        
+        cache_key = ('intent', query_lower, machine_filter, limit, self.catalog_version)
+        if use_cache:
+            cached = self.search_cache.get(cache_key)
+            if cached is not None:
+                return dict(cached, query=query)
+        
         query_tokens = query_lower.split()
         
-        # Oblicz token validity
-        token_validity = self.calculate_token_validity(query_tokens)
+        # Jeden przebieg klasyfikacji tokenów - wspólny dla validity, kodów i detekcji nonsensu
+        token_features = self.classify_tokens(
+            query_tokens, memo['token_features'] if memo is not None else None
+        )
+        token_validity = self.calculate_token_validity(query_tokens, token_features=token_features)
+        is_nonsense = self.is_obvious_nonsense(query_tokens, token_validity, token_features)
         
         # Specjalna obsługa marek luksusowych
         has_luxury_brand = any(
@@ -463,30 +1205,14 @@ class EcommerceBot:
         )
         
         # NOWA LOGIKA - Wykrywanie kodów produktów
-        potential_product_codes = []
-        for token in query_tokens:
-            token_upper = token.upper()
-            # Sprawdź czy token wygląda jak kod produktu
-            if (re.match(r'^[A-Z]\d{2,}', token_upper) or      # N123, E90
-                re.match(r'^\d{4,}', token) or                  # 0986494104
-                re.match(r'^[A-Z]{2,}\d{2,}', token_upper) or   # BMW320, TRW123
-                (len(token) >= 3 and                            # min 3 znaki
-                 any(c.isdigit() for c in token) and            # zawiera cyfrę
-                 not token.lower() in ['100', '200', '300'])):  # ale nie jest okrągłą liczbą
-                potential_product_codes.append(token)
+        potential_product_codes = [features.token for features in token_features if features.is_code_candidate]
         
         # Jeśli znaleziono potencjalne kody - sprawdź czy istnieją w bazie
         has_nonexistent_code = False
         if potential_product_codes:
             for code in potential_product_codes:
-                code_exists = False
                 # Sprawdź czy kod występuje w jakimkolwiek produkcie
-                for product in self.product_database['products']:
-                    if (code.upper() in product['model'].upper() or 
-                        code.upper() in product['id'] or
-                        code.upper() in product['name'].upper()):
-                        code_exists = True
-                        break
+                code_exists = self.product_code_exists(code)
                 
                 # Jeśli kod nie istnieje i wygląda jak prawdziwy kod
                 if not code_exists and len(code) >= 3:
@@ -494,13 +1220,17 @@ class EcommerceBot:
                     break
         
         # Znajdź najlepsze dopasowanie
-        matches = self.get_fuzzy_product_matches_internal(query_lower)
+        matches = self.get_fuzzy_product_matches_internal(
+            query_lower, machine_filter, search_session=search_session,
+            token_memo=memo['token_scores'] if memo is not None else None,
+            top_k=limit
+        )
         best_match_score = matches[0][1] if matches else 0
         
         # NOWA KLASYFIKACJA Z CHIRURGICZNĄ NAPRAWĄ
         
         # 0. NOWY WARUNEK - Detekcja oczywistego nonsensu (NAJWYŻSZY PRIORYTET)
-        if self.is_obvious_nonsense(query_tokens, token_validity):
+        if is_nonsense:
             confidence_level = 'LOW'
             suggestion_type = 'nonsensical'
             ga4_event = 'search_failure'
@@ -552,16 +1282,17 @@ class EcommerceBot:
             ga4_event = 'search_failure'
         
         # Debug output - DODANE INFORMACJE O NONSENSE CHECK
-        print(f"[ANALYSIS] Query: '{query}'")
-        print(f"  Token validity: {token_validity:.1f}")
-        print(f"  Best match: {best_match_score:.1f}")
-        print(f"  Has luxury: {has_luxury_brand}")
-        print(f"  Has code: {bool(potential_product_codes)}")
-        print(f"  Nonexistent code: {has_nonexistent_code}")
-        print(f"  Nonsense check: {self.is_obvious_nonsense(query_tokens, token_validity)}")
-        print(f"  Decision: {confidence_level} → {ga4_event}")
-        
-        return {
+        if verbose:
+            print(f"[ANALYSIS] Query: '{query}'")
+            print(f"  Token validity: {token_validity:.1f}")
+            print(f"  Best match: {best_match_score:.1f}")
+            print(f"  Has luxury: {has_luxury_brand}")
+            print(f"  Has code: {bool(potential_product_codes)}")
+            print(f"  Nonexistent code: {has_nonexistent_code}")
+            print(f"  Nonsense check: {is_nonsense}")
+            print(f"  Decision: {confidence_level} → {ga4_event}")
+        
+        analysis = {
             'query': query,
             'tokens': query_tokens,
             'token_validity': round(token_validity, 2),
@@ -571,139 +1302,356 @@ class EcommerceBot:
             'ga4_event': ga4_event,
             'has_luxury_brand': has_luxury_brand,
             'has_product_code': bool(potential_product_codes),
-            'is_nonsense': self.is_obvious_nonsense(query_tokens, token_validity),
-            'matches': matches[:6] if matches else []
+            'is_nonsense': is_nonsense,
+            'matches': matches[:limit] if matches else []
         }
+        
+        if use_cache:
+            self.search_cache.put(cache_key, analysis)
+        return dict(analysis)
     
     def normalize_query(self, query: str) -> str:
         """Normalizacja zapytania z obsługą literówek"""
         query = query.lower().strip()
         
-        # Podstawowe korekty literówek
-        typo_corrections = {
-            'kloki': 'klocki',
-            'klocek': 'klocki',
-            'filtr': 'filtr',
-            'filetr': 'filtr',
-            'amortyztor': 'amortyzator',
-            'swica': 'świeca',
-            'swieca': 'świeca',
-            'gol': 'golf',
-            'vw': 'volkswagen',
-            'mb': 'mercedes',
-            'yam': 'yamaha',
-            'sprin': 'sprinter'
-        }
-        
-        for typo, correction in typo_corrections.items():
-            query = query.replace(typo, correction)
-        
-        return ' '.join(query.split())
+        # Jeden przebieg po tokenach - koszt nie zależy od liczby reguł
+        return self.query_rewriter.rewrite(query)
     
-    def get_fuzzy_product_matches_internal(self, query: str, machine_filter: Optional[str] = None) -> List[Tuple]:
-        """CAŁKOWICIE PRZEPISANA - Naprawiony algorytm który nagradza precyzję"""
-        matches = []
-        query_tokens = query.lower().split()
-        
-        for product in self.product_database['products']:
-            if machine_filter and product['machine'] != machine_filter and product['machine'] != 'uniwersalny':
+    def compute_token_match_scores(self, query_tokens: List[str], search_session: Optional[str] = None,
+                                   memo: Optional[Dict] = None,
+                                   partition: Optional[SearchPartition] = None) -> Dict[str, Dict[str, float]]:
+        """Wyniki tokenów zapytania względem słownika - przyrostowo względem poprzedniego zapytania sesji
+        
+        memo - słownik partycja -> token -> wyniki współdzielony między zapytaniami (analiza wsadowa)
+        partition - partycja typu pojazdu (domyślnie cały katalog)
+        """
+        if partition is None:
+            partition = self.get_search_partition()
+        if memo is not None:
+            memo = memo.setdefault(partition.machine, {})
+        
+        previous = self.incremental_searches.get(search_session) if search_session else None
+        if previous is not None and (previous['catalog_version'] != partition.catalog_version
+                                     or previous['machine'] != partition.machine):
+            previous = None
+        previous_scores = previous['token_match_scores'] if previous is not None else {}
+        
+        token_match_scores = {}
+        for q_token in query_tokens:
+            if q_token in token_match_scores:
                 continue
             
-            # Przygotowanie tokenów produktu
-            product_text = f"{product['name']} {product['brand']} {product['model']} {product['category']}"
-            product_tokens = product_text.lower().split()
-            
-            # NOWY ALGORYTM - DOPASOWANIE PER TOKEN
-            token_scores = []
-            
-            for q_token in query_tokens:
-                best_token_match = 0
-                
-                # Sprawdź każdy token produktu
-                for p_token in product_tokens:
-                    if q_token == p_token:
-                        # Dokładne dopasowanie = 100%
-                        best_token_match = 100
-                        break
-                    elif p_token.startswith(q_token) and len(q_token) >= 2:
-                        # Prefix match (np. "gol" -> "golf")
-                        match_ratio = len(q_token) / len(p_token)
-                        best_token_match = max(best_token_match, 95 * match_ratio)
-                    elif q_token.startswith(p_token) and len(p_token) >= 2:
-                        # Suffix match
-                        match_ratio = len(p_token) / len(q_token)
-                        best_token_match = max(best_token_match, 90 * match_ratio)
-                    else:
-                        # Fuzzy match
-                        similarity = fuzz.ratio(q_token, p_token)
-                        if similarity > 80:
-                            best_token_match = max(best_token_match, similarity * 0.95)
-                        elif similarity > 70:
-                            best_token_match = max(best_token_match, similarity * 0.85)
-                
-                token_scores.append(best_token_match)
+            if memo is not None and q_token in memo:
+                token_match_scores[q_token] = memo[q_token]
+                continue
             
-            # KLUCZOWE: Oblicz wynik końcowy
-            if not token_scores:
+            # Token bez zmian od poprzedniego naciśnięcia klawisza
+            if q_token in previous_scores:
+                token_match_scores[q_token] = previous_scores[q_token]
                 continue
-                
-            # Średnia ważona
-            base_score = sum(token_scores) / len(token_scores)
             
-            # NAGRODA ZA PRECYZJĘ - KRYTYCZNE!
-            if len(query_tokens) > 1:
-                # Jeśli WSZYSTKIE tokeny dobrze pasują = DUŻY BONUS
-                if all(score > 70 for score in token_scores):
-                    base_score *= 1.3  # 30% bonus za pełne dopasowanie
-                elif all(score > 60 for score in token_scores):
-                    base_score *= 1.2  # 20% bonus
-                elif all(score > 50 for score in token_scores):
-                    base_score *= 1.1  # 10% bonus
-                # Kara tylko za bardzo słabe dopasowanie
-                elif any(score < 20 for score in token_scores):
-                    base_score *= 0.8  # 20% kara za nonsensowne tokeny
+            # Ten sam token w innym requeście ("kloki", "bilsten" wracają cały dzień)
+            cache_key = ('tokens', partition.machine, q_token, partition.catalog_version)
+            cached = self.token_score_cache.get(cache_key)
+            if cached is not None:
+                token_match_scores[q_token] = cached
+                if memo is not None:
+                    memo[q_token] = cached
+                continue
             
-            # Dodatkowe bonusy kontekstowe
-            bonus = 0
+            # Token wydłużony ("bo" -> "bos") - zawężamy poprzedni zbiór dopasowań
+            narrowed_from = None
+            for prev_token, prev_token_scores in previous_scores.items():
+                if len(prev_token) >= 2 and q_token.startswith(prev_token):
+                    if narrowed_from is None or len(prev_token_scores) < len(narrowed_from):
+                        narrowed_from = prev_token_scores
             
-            # Bonus za markę
-            brand_lower = product['brand'].lower()
+            token_match_scores[q_token] = self.score_query_token(q_token, narrowed_from, partition)
+            if memo is not None:
+                memo[q_token] = token_match_scores[q_token]
+            else:
+                self.token_score_cache.put(cache_key, token_match_scores[q_token])
+        
+        if search_session:
+            self.incremental_searches.put(search_session, {
+                'catalog_version': partition.catalog_version,
+                'machine': partition.machine,
+                'token_match_scores': token_match_scores
+            })
+        
+        return token_match_scores
+    
+    def get_fuzzy_product_matches_internal(self, query: str, machine_filter: Optional[str] = None,
+                                           search_session: Optional[str] = None,
+                                           token_memo: Optional[Dict] = None,
+                                           top_k: Optional[int] = None) -> List[Tuple]:
+        """CAŁKOWICIE PRZEPISANA - Naprawiony algorytm który nagradza precyzję
+        
+        top_k - zwraca tylko k najlepszych wyników (ta sama kolejność co pełne sortowanie)
+        """
+        matches = []
+        query_tokens = query.lower().split()
+        
+        if not query_tokens:
+            return matches
+        
+        # Filtr typu pojazdu = osobna partycja indeksów (słownik i kandydaci tylko z tego typu)
+        partition = self.get_search_partition(machine_filter)
+        
+        # Wyniki tokenów liczone raz na słownik katalogu, nie per produkt
+        token_match_scores = self.compute_token_match_scores(query_tokens, search_session, token_memo, partition)
+        
+        if partition.vector_engine is not None:
+            matches = self.score_products_vector(query, query_tokens, token_match_scores, partition)
+        elif top_k:
+            return self.score_products_top_k(query, query_tokens, token_match_scores, partition, top_k)
+        else:
+            matches = self.score_products_scalar(query, query_tokens, token_match_scores, partition)
+        
+        if top_k:
+            # nsmallest jest stabilny - remisy w kolejności katalogu, jak przy sort()
+            return heapq.nsmallest(top_k, matches, key=lambda x: -x[1])
+        
+        # Sortowanie malejąco po wyniku
+        matches.sort(key=lambda x: x[1], reverse=True)
+        return matches
+    
+    def score_products_scalar(self, query: str, query_tokens: List[str],
+                              token_match_scores: Dict[str, Dict[str, float]],
+                              partition: SearchPartition) -> List[Tuple]:
+        """Skalarny scoring kandydatów z indeksu odwróconego partycji (kolejność katalogu)"""
+        matches = []
+        token_index = partition.token_index
+        
+        # Kandydaci z indeksu odwróconego - tylko produkty z trafionym tokenem
+        candidates = set()
+        for scores in token_match_scores.values():
+            for p_token in scores:
+                candidates.update(token_index[p_token])
+        
+        # Bonus za markę może sam dać >= 25 pkt (marka + model/kategoria)
+        for brand_lower, positions in partition.brand_index.items():
             if brand_lower in query or query in brand_lower:
-                bonus += 15
+                candidates.update(positions)
+        
+        products = partition.products
+        product_features = partition.product_features
+        
+        for position in sorted(candidates):
+            final_score = self.score_candidate(query, query_tokens, token_match_scores, product_features[position])
             
-            # Bonus za model produktu
-            model_lower = product['model'].lower()
+            # Tylko produkty z sensownym dopasowaniem
+            if final_score >= 25:
+                matches.append((products[position], round(final_score)))
+        
+        return matches
+    
+    def score_candidate(self, query: str, query_tokens: List[str],
+                        token_match_scores: Dict[str, Dict[str, float]],
+                        features: ProductFeatures) -> float:
+        """Wynik produktu (przed zaokrągleniem) - wspólny dla pełnego scoringu i top-k"""
+        product_tokens = features.tokens
+        
+        # NOWY ALGORYTM - DOPASOWANIE PER TOKEN
+        token_scores = []
+        
+        for q_token in query_tokens:
+            scores = token_match_scores[q_token]
+            best_token_match = 0
+            for p_token in product_tokens:
+                best_token_match = max(best_token_match, scores.get(p_token, 0))
+            token_scores.append(best_token_match)
+        
+        # Średnia ważona
+        base_score = sum(token_scores) / len(token_scores)
+        
+        # NAGRODA ZA PRECYZJĘ - KRYTYCZNE!
+        if len(query_tokens) > 1:
+            # Jeśli WSZYSTKIE tokeny dobrze pasują = DUŻY BONUS
+            if all(score > 70 for score in token_scores):
+                base_score *= 1.3  # 30% bonus za pełne dopasowanie
+            elif all(score > 60 for score in token_scores):
+                base_score *= 1.2  # 20% bonus
+            elif all(score > 50 for score in token_scores):
+                base_score *= 1.1  # 10% bonus
+            # Kara tylko za bardzo słabe dopasowanie
+            elif any(score < 20 for score in token_scores):
+                base_score *= 0.8  # 20% kara za nonsensowne tokeny
+        
+        # Dodatkowe bonusy kontekstowe
+        bonus = 0
+        
+        # Bonus za markę
+        brand_lower = features.brand_lower
+        if brand_lower and (brand_lower in query or query in brand_lower):
+            bonus += 15
+        
+        # Bonus za model produktu
+        model_lower = features.model_lower
+        for q_token in query_tokens:
+            if len(q_token) > 2 and q_token in model_lower:
+                bonus += 10
+                break
+        
+        # Bonus za kategorię
+        category = features.category_lower
+        for q_token in query_tokens:
+            if q_token in category:
+                bonus += 10
+                break
+        
+        # Finalne obliczenie
+        return min(100, base_score + bonus)
+    
+    def score_products_top_k(self, query: str, query_tokens: List[str],
+                             token_match_scores: Dict[str, Dict[str, float]],
+                             partition: SearchPartition, top_k: int) -> List[Tuple]:
+        """Top-k z górnymi ograniczeniami wyników (MaxScore) - pełny scoring tylko dla produktów,
+        które jeszcze mogą wejść do top-k. Wynik identyczny z pełnym scoringiem posortowanym i obciętym.
+        """
+        token_index = partition.token_index
+        
+        # Górne ograniczenie tokenu = najlepszy wynik tokenu w słowniku
+        token_hits = {}
+        token_upper_bounds = {}
+        for q_token, scores in token_match_scores.items():
+            hits = set()
+            for p_token in scores:
+                hits.update(token_index[p_token])
+            token_hits[q_token] = hits
+            token_upper_bounds[q_token] = max(scores.values(), default=0)
+        
+        brand_positions = set()
+        for brand_lower, positions in partition.brand_index.items():
+            if brand_lower in query or query in brand_lower:
+                brand_positions.update(positions)
+        
+        products = partition.products
+        product_features = partition.product_features
+        multi_token = len(query_tokens) > 1
+        model_bonuses = {}
+        category_bonuses = {}
+        
+        bounded = []
+        for position in brand_positions.union(*token_hits.values()):
+            upper_bound = 0
+            all_tokens_hit = True
             for q_token in query_tokens:
-                if len(q_token) > 2 and q_token in model_lower:
-                    bonus += 10
-                    break
+                if position in token_hits[q_token]:
+                    upper_bound += token_upper_bounds[q_token]
+                else:
+                    all_tokens_hit = False
+            upper_bound /= len(query_tokens)
             
-            # Bonus za kategorię
-            category = product['category'].lower()
-            for q_token in query_tokens:
-                if q_token in category:
-                    bonus += 10
-                    break
+            # Token bez trafienia ma wynik 0 - wtedy mnożnik precyzji to na pewno kara 0.8
+            if multi_token:
+                upper_bound *= 1.3 if all_tokens_hit else 0.8
             
-            # Finalne obliczenie
-            final_score = min(100, base_score + bonus)
+            # Bonusy są tanie - liczymy je dokładnie, raz na unikalny model/kategorię
+            features = product_features[position]
+            bonus = 15 if position in brand_positions else 0
+            model_lower = features.model_lower
+            if model_lower not in model_bonuses:
+                model_bonuses[model_lower] = 10 if any(
+                    len(q_token) > 2 and q_token in model_lower for q_token in query_tokens) else 0
+            bonus += model_bonuses[model_lower]
+            category = features.category_lower
+            if category not in category_bonuses:
+                category_bonuses[category] = 10 if any(q_token in category for q_token in query_tokens) else 0
+            bonus += category_bonuses[category]
             
-            # Tylko produkty z sensownym dopasowaniem
-            if final_score >= 25:
-                matches.append((product, round(final_score)))
+            upper_bound = min(100, upper_bound + bonus)
+            if upper_bound >= 25:
+                bounded.append((-upper_bound, position))
+        
+        # Kandydaci od najwyższego ograniczenia; kopiec trzyma k najlepszych (wynik, -pozycja)
+        bounded.sort()
+        heap = []
+        for negative_bound, position in bounded:
+            if len(heap) == top_k and round(-negative_bound) < heap[0][0]:
+                break
+            
+            final_score = self.score_candidate(query, query_tokens, token_match_scores, product_features[position])
+            if final_score < 25:
+                continue
+            
+            entry = (round(final_score), -position)
+            if len(heap) < top_k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
         
-        # Sortowanie malejąco po wyniku
-        matches.sort(key=lambda x: x[1], reverse=True)
-        return matches
+        return [(products[-negative_position], score) for score, negative_position in sorted(heap, reverse=True)]
+    
+    def score_products_vector(self, query: str, query_tokens: List[str],
+                              token_match_scores: Dict[str, Dict[str, float]],
+                              partition: SearchPartition) -> List[Tuple]:
+        """Wektorowy scoring całej partycji (NumPy) - te same wyniki co score_products_scalar"""
+        products = partition.products
+        return [
+            (products[position], score)
+            for position, score in partition.vector_engine.score(query, query_tokens, token_match_scores)
+        ]
+    
+    def compare_scoring_engines(self, queries: List[str], machine_filters: Tuple = (None,)) -> Dict:
+        """Test zgodności: porównuje wyniki silnika skalarnego i wektorowego dla listy zapytań"""
+        if not numpy_available():
+            return {'available': False, 'checked': 0, 'mismatches': []}
+        
+        mismatches = []
+        checked = 0
+        
+        # Partycje z jednego snapshotu + silnik wektorowy każdej (zbudowany na potrzeby testu jeśli wyłączony)
+        partitions = {}
+        vector_engines = {}
+        for machine_filter in machine_filters:
+            partition = self.get_search_partition(machine_filter)
+            partitions[machine_filter] = partition
+            if partition.machine not in vector_engines:
+                vector_engines[partition.machine] = partition.vector_engine or self.build_vector_engine(
+                    partition.product_features, partition.sorted_vocabulary, partition.positions)
+        
+        for query in queries:
+            query_tokens = query.lower().split()
+            if not query_tokens:
+                continue
+            for machine_filter in machine_filters:
+                partition = partitions[machine_filter]
+                products = partition.products
+                token_match_scores = self.compute_token_match_scores(query_tokens, partition=partition)
+                scalar = [
+                    (product['id'], score)
+                    for product, score in self.score_products_scalar(query, query_tokens, token_match_scores, partition)
+                ]
+                vector = [
+                    (products[position]['id'], score)
+                    for position, score in vector_engines[partition.machine].score(query, query_tokens, token_match_scores)
+                ]
+                checked += 1
+                if scalar != vector:
+                    mismatches.append({
+                        'query': query,
+                        'machine_filter': machine_filter,
+                        'scalar': scalar[:10],
+                        'vector': vector[:10]
+                    })
+        
+        return {'available': True, 'checked': checked, 'mismatches': mismatches}
     
     def get_fuzzy_product_matches(self, query: str, machine_filter: Optional[str] = None, 
-                                  limit: int = 6, analyze_intent: bool = True) -> Tuple:
-        """Ulepszona funkcja dopasowania z analizą intencji"""
+                                  limit: int = 6, analyze_intent: bool = True,
+                                  search_session: Optional[str] = None) -> Tuple:
+        """Ulepszona funkcja dopasowania z analizą intencji
+        
+        search_session - identyfikator sesji dla wyszukiwania przyrostowego (autocomplete)
+        """
         query = self.normalize_query(query)
         
         if analyze_intent:
             # Pełna analiza intencji
-            analysis = self.analyze_query_intent(query)
+            # Gałąź LOW pokazuje zawsze do 3 wyników
+            analysis = self.analyze_query_intent(query, machine_filter, search_session=search_session,
+                                                 limit=max(limit, 3))
             
             # Filtruj wyniki na podstawie confidence level
             if analysis['confidence_level'] == 'HIGH':
@@ -721,8 +1669,88 @@ class EcommerceBot:
             )
         else:
             # Stare zachowanie dla kompatybilności wstecznej
-            matches = self.get_fuzzy_product_matches_internal(query, machine_filter)
-            return matches[:limit]
+            cache_key = ('matches', query, machine_filter, limit, self.catalog_version)
+            matches = self.search_cache.get(cache_key)
+            if matches is None:
+                matches = self.get_fuzzy_product_matches_internal(query, machine_filter, search_session,
+                                                                  top_k=limit)
+                self.search_cache.put(cache_key, matches)
+            return matches
+    
+    def summarize_analysis(self, analysis: Dict) -> Dict:
+        """Klasyfikacja zapytania w formie gotowej do JSON (bez pełnych obiektów produktów)"""
+        return {
+            'query': analysis['query'],
+            'token_validity': analysis['token_validity'],
+            'best_match_score': analysis['best_match_score'],
+            'confidence_level': analysis['confidence_level'],
+            'suggestion_type': analysis['suggestion_type'],
+            'ga4_event': analysis['ga4_event'],
+            'has_luxury_brand': analysis['has_luxury_brand'],
+            'has_product_code': analysis['has_product_code'],
+            'is_nonsense': analysis['is_nonsense'],
+            'matches': [{'id': product['id'], 'score': score} for product, score in analysis['matches']]
+        }
+    
+    def analyze_batch(self, queries: List[str], workers: int = 0, normalize: bool = True,
+                      machine_filter: Optional[str] = None) -> List[Dict]:
+        """Wsadowa klasyfikacja zapytań - bez GA4, dashboardu, logów i bez zaśmiecania cache
+        
+        Powtórzone zapytania są analizowane raz, a wyniki tokenów (validity, dopasowania do słownika)
+        są współdzielone w obrębie całej paczki. workers > 1 rozkłada pracę na pulę procesów.
+        machine_filter - klasyfikacja w kontekście typu pojazdu (jak w sesji z wybranym pojazdem)
+        """
+        if workers > 1 and len(queries) >= BATCH_MIN_PARALLEL:
+            # Pula procesów startowana z wątku tpool zakleszcza się pod eventlet - start na hubie,
+            # a czekanie na wyniki (futures na zielonych blokadach) nie blokuje huba
+            return self.analyze_batch_parallel(queries, workers, normalize, machine_filter)
+        # Czysto obliczeniowa praca - w prawdziwym wątku, żeby nie zamrozić huba eventlet (autocomplete na żywo)
+        return run_blocking(self.analyze_batch_local, queries, normalize, machine_filter)
+    
+    def analyze_batch_local(self, queries: List[str], normalize: bool = True,
+                            machine_filter: Optional[str] = None) -> List[Dict]:
+        """Analiza wsadowa w bieżącym procesie (wspólne memo tokenów dla całej paczki)"""
+        memo = {'token_features': {}, 'token_scores': {}}
+        classifications = {}
+        results = []
+        
+        for query in queries:
+            normalized = self.normalize_query(query) if normalize else query.lower().strip()
+            
+            classification = classifications.get(normalized)
+            if classification is None:
+                analysis = self.analyze_query_intent(normalized, machine_filter, verbose=False,
+                                                     use_cache=False, memo=memo)
+                classification = self.summarize_analysis(analysis)
+                classifications[normalized] = classification
+            
+            results.append(dict(classification, query=query, normalized_query=normalized))
+        
+        return results
+    
+    def analyze_batch_parallel(self, queries: List[str], workers: int, normalize: bool,
+                               machine_filter: Optional[str] = None) -> List[Dict]:
+        """Rozkłada analizę wsadową na pulę procesów (kolejność wyników zachowana)"""
+        chunk_size = max(1, -(-len(queries) // (workers * 4)))
+        chunks = [queries[i:i + chunk_size] for i in range(0, len(queries), chunk_size)]
+        
+        # fork - procesy dziedziczą gotowe indeksy; spawn - każdy proces buduje własnego bota.
+        # Pod eventlet tylko spawn: sforkowany proces dziedziczy hub i wykonuje zielone wątki rodzica
+        if 'fork' in multiprocessing.get_all_start_methods() and not eventlet_patched():
+            context = multiprocessing.get_context('fork')
+            initargs = (self,)
+        else:
+            context = multiprocessing.get_context('spawn')
+            initargs = (None,)
+        
+        results = []
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=init_batch_worker, initargs=initargs) as executor:
+            for chunk_results in executor.map(analyze_batch_chunk, chunks, [normalize] * len(chunks),
+                                              [machine_filter] * len(chunks)):
+                results.extend(chunk_results)
+        
+        return results
     
     def get_fuzzy_faq_matches(self, query: str, limit: int = 5) -> List[Tuple]:
         """FAQ z predykcją znak-po-znaku + progresywny scoring"""
@@ -733,9 +1761,21 @@ class EcommerceBot:
         
         matches = []
         
-        for faq in self.faq_database:
-            question_lower = faq['question'].lower()
-            keywords_lower = [k.lower() for k in faq['keywords']]
+        # FAQ, których pytanie lub słowo kluczowe zawiera zapytanie
+        candidates = set()
+        for question_lower in self.faq_question_index.find(query):
+            candidates.update(self.faq_positions_by_question[question_lower])
+        for keyword in self.faq_keyword_index.find(query):
+            candidates.update(self.faq_positions_by_keyword[keyword])
+        
+        # partial_ratio tylko dla pozostałych FAQ ze wspólnym trigramem w pytaniu (bez polskich znaków)
+        if len(query) >= 4:
+            for folded_question in self.faq_folded_question_index.overlapping(fold_diacritics(query)):
+                candidates.update(self.faq_positions_by_folded_question[folded_question])
+        
+        for position in sorted(candidates):
+            faq = self.faq_database[position]
+            question_lower, keywords_lower = self.faq_features[position]
             
             best_score = 0
             
@@ -815,40 +1855,14 @@ class EcommerceBot:
         return ' '.join(product_hints) if product_hints else query
     
     def send_ga4_event(self, event_data: Dict) -> bool:
-        """Wysyła zdarzenie do GA4"""
-        try:
-            GA4_MEASUREMENT_ID = "G-ECOMMERCE123"
-            GA4_API_SECRET = "YOUR_API_SECRET_HERE"
-            
-            session_data = f"universal_soldier_{int(time.time() // 3600)}"
-            client_id = hashlib.md5(session_data.encode()).hexdigest()
-            
-            url = "https://www.google-analytics.com/mp/collect"
-            params = {
-                'measurement_id': GA4_MEASUREMENT_ID,
-                'api_secret': GA4_API_SECRET
-            }
-            
-            payload = {
-                "client_id": client_id,
-                "events": [{
-                    "name": event_data['event'],
-                    "params": event_data['params']
-                }]
-            }
-            
-            response = requests.post(url, params=params, json=payload, timeout=5)
-            
-            if response.status_code == 204:
-                print(f"[GA4] ✅ Event sent: {event_data['event']} for query: '{event_data['params']['query']}'")
-                return True
-            else:
-                print(f"[GA4] ❌ Failed to send event. Status: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            print(f"[GA4] 💥 Error sending event: {e}")
+        """Wrzuca zdarzenie GA4 do kolejki wysyłki (False = kolejka pełna, zdarzenie odrzucone)"""
+        session_data = f"universal_soldier_{int(time.time() // 3600)}"
+        client_id = hashlib.md5(session_data.encode()).hexdigest()
+        
+        if not self.ga4_dispatcher.enqueue(client_id, event_data['event'], event_data['params']):
+            print(f"[GA4] ❌ Queue full, event dropped: {event_data['event']}")
             return False
+        return True
         
     def search_products(self, query: str, machine_filter: Optional[str] = None) -> List:
         """Wyszukiwanie produktów (kompatybilność wsteczna)"""
@@ -1107,11 +2121,7 @@ Jeśli wiele osób szuka tego produktu, dodamy go do naszej oferty.
     
     def show_product_details(self, product_id: str, match_score: Optional[int] = None) -> Dict:
         """Szczegóły produktu"""
-        product = None
-        for p in self.product_database['products']:
-            if p['id'] == product_id:
-                product = p
-                break
+        product = self.get_product(product_id)
         
         if not product:
             return {
@@ -1132,11 +2142,7 @@ Jeśli wiele osób szuka tego produktu, dodamy go do naszej oferty.
         }
     def show_full_product_card(self, product_id: str) -> Dict:
         """Pokazuje pełną kartę produktu bez pośrednich kroków"""
-        product = None
-        for p in self.product_database['products']:
-            if p['id'] == product_id:
-                product = p
-                break
+        product = self.get_product(product_id)
         
         if not product:
             return {
@@ -1158,19 +2164,43 @@ Jeśli wiele osób szuka tego produktu, dodamy go do naszej oferty.
     
     def add_to_cart(self, product_id: str) -> Dict:
         """Dodanie do koszyka"""
+        if self.get_product(product_id) is None:
+            return {
+                'text_message': 'Produkt nie znaleziony.',
+                'buttons': [{'text': '↩️ Menu główne', 'action': 'main_menu'}]
+            }
+        
         if 'cart' not in session:
             session['cart'] = []
         
         session['cart'].append(product_id)
         session.modified = True
         
+        cart_products = self.get_products(session['cart'])
+        cart_total = sum(p['price'] for p in cart_products)
+        
         return {
-            'text_message': f"""✅ **Dodano do koszyka!**""",
+            'text_message': f"""✅ **Dodano do koszyka!**
+
+🛒 W koszyku: {len(cart_products)} szt. ({cart_total:.2f} zł netto)""",
             'cart_updated': True,
             'buttons': [
                 {'text': '🔍 Kontynuuj zakupy', 'action': 'search_product'},
                 {'text': '↩️ Menu główne', 'action': 'main_menu'}
             ]
-        }    
+        }
+
+
+# === ANALIZA WSADOWA - PROCESY ROBOCZE ===
+batch_worker_bot = None
+
+
+def init_batch_worker(bot: Optional[EcommerceBot] = None):
+    """Inicjalizacja procesu roboczego puli analizy wsadowej"""
+    global batch_worker_bot
+    batch_worker_bot = bot if bot is not None else EcommerceBot()
 
 
+def analyze_batch_chunk(queries: List[str], normalize: bool, machine_filter: Optional[str] = None) -> List[Dict]:
+    """Analizuje fragment paczki w procesie roboczym"""
+    return batch_worker_bot.analyze_batch_local(queries, normalize, machine_filter)
@@ -0,0 +1,94 @@
+"""
+Uniwersalny Żołnierz - Lokalny stub endpointu GA4 Measurement Protocol
+Przyjmuje zdarzenia zamiast google-analytics.com - do sprawdzania wysyłki, bufora dyskowego i replay
+
+Użycie: python ga4_stub_server.py [port] [status]
+        GA4_ENDPOINT=http://127.0.0.1:8787/mp/collect python app.py
+status (domyślnie 204) - np. 503 symuluje awarię endpointu
+"""
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+
+class GA4StubServer:
+    """Serwer HTTP w wątku w tle - zapamiętuje przyjęte zdarzenia, status odpowiedzi można zmieniać"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, status: int = 204, verbose: bool = False):
+        self.status = status
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.received = []  # (client_id, zdarzenie) przyjęte z odpowiedzią 2xx
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), self.handler_class())
+        self.thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/mp/collect'
+
+    def handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    payload = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    payload = None
+                status = stub.record(payload)
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def record(self, payload) -> int:
+        """Zapamiętuje zdarzenia żądania - zwraca status HTTP odpowiedzi"""
+        with self.lock:
+            self.requests += 1
+            status = self.status
+            if not isinstance(payload, dict) or not isinstance(payload.get('events'), list):
+                return 400
+            if 200 <= status < 300:
+                for event in payload['events']:
+                    self.received.append((payload.get('client_id'), event))
+        if self.verbose:
+            names = ', '.join(str(event.get('name')) for event in payload['events'])
+            print(f"[GA4 STUB] {status} client_id={payload.get('client_id')}: {names}")
+        return status
+
+    def set_status(self, status: int):
+        with self.lock:
+            self.status = status
+
+    def events(self) -> List[Dict]:
+        with self.lock:
+            return [event for _, event in self.received]
+
+    def start(self) -> 'GA4StubServer':
+        self.thread = threading.Thread(target=self.server.serve_forever, name='ga4-stub', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8787
+    status = int(sys.argv[2]) if len(sys.argv) > 2 else 204
+    stub = GA4StubServer(port=port, status=status, verbose=True)
+    print(f"[GA4 STUB] Listening on {stub.endpoint} (status {status})")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()
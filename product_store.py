@@ -0,0 +1,161 @@
+"""
+Uniwersalny Żołnierz - Kolumnowy magazyn produktów
+Zamiast słownika na każdy SKU: kolumny, internowane marki/kategorie/typy pojazdów i tablice liczb
+"""
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List
+
+PRODUCT_KEYS = ('id', 'name', 'category', 'machine', 'brand', 'model', 'price', 'stock')
+
+# Zakres kolumny stanów magazynowych (array('i'))
+STOCK_MAX = 2 ** (8 * array('i').itemsize - 1) - 1
+STOCK_MIN = -STOCK_MAX - 1
+
+
+def clamp_stock(stock: int) -> int:
+    """Stan magazynowy przycięty do zakresu kolumny stocks"""
+    return min(max(stock, STOCK_MIN), STOCK_MAX)
+
+
+class InternedColumn:
+    """Kolumna o małej liczbie unikalnych wartości - przechowuje indeksy do listy wartości"""
+
+    def __init__(self):
+        self.values = []
+        self.lookup = {}
+        self.ids = array('I')
+
+    def append(self, value: str):
+        value_id = self.lookup.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            value = sys.intern(value)
+            self.values.append(value)
+            self.lookup[value] = value_id
+        self.ids.append(value_id)
+
+    def __getitem__(self, position: int) -> str:
+        return self.values[self.ids[position]]
+
+
+class ProductView(Mapping):
+    """Widok produktu z dostępem jak do słownika (product['name'], product.get('stock'))"""
+    __slots__ = ('store', 'position')
+
+    def __init__(self, store: 'ProductStore', position: int):
+        self.store = store
+        self.position = position
+
+    def __getitem__(self, key: str):
+        column = self.store.columns.get(key)
+        if column is None:
+            raise KeyError(key)
+        return column[self.position]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(PRODUCT_KEYS)
+
+    def __len__(self) -> int:
+        return len(PRODUCT_KEYS)
+
+    def to_dict(self) -> Dict:
+        """Zwykły słownik - np. do serializacji JSON"""
+        return {key: self[key] for key in PRODUCT_KEYS}
+
+    def __repr__(self) -> str:
+        return f"ProductView({self.to_dict()!r})"
+
+
+class ProductStore:
+    """Kolumnowy katalog produktów - sekwencja widoków ProductView"""
+
+    def __init__(self, products: Iterable[Dict] = ()):
+        self.ids = []
+        self.names = []
+        self.models = []
+        self.brands = InternedColumn()
+        self.categories = InternedColumn()
+        self.machines = InternedColumn()
+        self.prices = array('d')
+        self.stocks = array('i')
+        self.columns = {
+            'id': self.ids,
+            'name': self.names,
+            'category': self.categories,
+            'machine': self.machines,
+            'brand': self.brands,
+            'model': self.models,
+            'price': self.prices,
+            'stock': self.stocks
+        }
+        for product in products:
+            self.append(product)
+
+    def append(self, product: Dict) -> ProductView:
+        """Dodaje produkt (słownik w formacie product_database) i zwraca jego widok"""
+        # Liczby najpierw - błędna wartość nie może zostawić kolumn o różnej długości
+        price = float(product['price'])
+        stock = clamp_stock(int(product['stock']))
+        self.ids.append(product['id'])
+        self.names.append(product['name'])
+        self.models.append(product['model'])
+        self.brands.append(product['brand'])
+        self.categories.append(product['category'])
+        self.machines.append(product['machine'])
+        self.prices.append(price)
+        self.stocks.append(stock)
+        return ProductView(self, len(self.ids) - 1)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [ProductView(self, i) for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('product position out of range')
+        return ProductView(self, position)
+
+    def __iter__(self) -> Iterator[ProductView]:
+        for position in range(len(self.ids)):
+            yield ProductView(self, position)
+
+    def memory_usage(self) -> Dict:
+        """Szacunkowe zużycie pamięci magazynu (bajty) - do porównania ze słownikami"""
+        total = sum(sys.getsizeof(column) for column in (self.ids, self.names, self.models))
+        total += sum(sys.getsizeof(value) for column in (self.ids, self.names, self.models) for value in column)
+        for column in (self.brands, self.categories, self.machines):
+            total += sys.getsizeof(column.ids) + sys.getsizeof(column.values)
+            total += sum(sys.getsizeof(value) for value in column.values)
+        total += sys.getsizeof(self.prices) + sys.getsizeof(self.stocks)
+
+        count = len(self)
+        return {
+            'products': count,
+            'bytes': total,
+            'bytes_per_product': round(total / count, 1) if count else 0
+        }
+
+
+def dict_memory_usage(products: List[Dict]) -> Dict:
+    """Szacunkowe zużycie pamięci katalogu jako listy słowników (punkt odniesienia)"""
+    total = sys.getsizeof(products)
+    seen = set()
+    for product in products:
+        total += sys.getsizeof(product)
+        for value in product.values():
+            # Ten sam obiekt liczymy raz (np. literały współdzielone przez interpreter)
+            if id(value) not in seen:
+                seen.add(id(value))
+                total += sys.getsizeof(value)
+
+    count = len(products)
+    return {
+        'products': count,
+        'bytes': total,
+        'bytes_per_product': round(total / count, 1) if count else 0
+    }
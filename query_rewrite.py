@@ -0,0 +1,89 @@
+"""
+Uniwersalny Żołnierz - Silnik przepisywania zapytań (literówki, synonimy)
+Reguły działają na całych tokenach w jednym przebiegu - koszt nie rośnie z liczbą reguł
+"""
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+def load_rewrite_rules(path: str) -> Iterator[Tuple[str, str]]:
+    """Reguły z pliku jako pary (wzorzec, zamiennik)
+
+    Obsługiwane formaty:
+      rules.json - obiekt {"wzorzec": "zamiennik"} albo lista par,
+      rules.tsv / rules.txt - jedna reguła na linię: wzorzec<TAB>zamiennik
+                              albo wzorzec => zamiennik, '#' rozpoczyna komentarz
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        pairs = data.items() if isinstance(data, dict) else data
+        for pattern, replacement in pairs:
+            yield str(pattern), str(replacement)
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if '\t' in line:
+                pattern, _, replacement = line.partition('\t')
+            elif '=>' in line:
+                pattern, _, replacement = line.partition('=>')
+            else:
+                raise ValueError(f"Invalid rewrite rule in {path}:{line_number}: {line}")
+            yield pattern.strip(), replacement.strip()
+
+
+class QueryRewriter:
+    """Mapa fraza (krotka tokenów) -> zamiennik; najdłuższe dopasowanie od lewej, bez łańcuchowania reguł"""
+
+    def __init__(self, rules: Iterable[Tuple[str, str]] = ()):
+        self.rules = {}
+        self.max_phrase_length = 1
+        for pattern, replacement in rules:
+            self.add(pattern, replacement)
+
+    @classmethod
+    def from_mapping(cls, mapping: Dict[str, str]) -> 'QueryRewriter':
+        return cls(mapping.items())
+
+    def add(self, pattern: str, replacement: str):
+        """Dodaje regułę (późniejsza reguła dla tej samej frazy nadpisuje wcześniejszą)"""
+        phrase = tuple(pattern.lower().split())
+        if not phrase:
+            raise ValueError('Empty rewrite pattern')
+        self.rules[phrase] = tuple(replacement.lower().split())
+        self.max_phrase_length = max(self.max_phrase_length, len(phrase))
+
+    def update(self, rules: Iterable[Tuple[str, str]]):
+        for pattern, replacement in rules:
+            self.add(pattern, replacement)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def rewrite_tokens(self, tokens: List[str]) -> List[str]:
+        """Jeden przebieg po tokenach - na każdej pozycji co najwyżej max_phrase_length odczytów słownika"""
+        result = []
+        position = 0
+        count = len(tokens)
+        while position < count:
+            for length in range(min(self.max_phrase_length, count - position), 0, -1):
+                replacement = self.rules.get(tuple(tokens[position:position + length]))
+                if replacement is not None:
+                    result.extend(replacement)
+                    position += length
+                    break
+            else:
+                result.append(tokens[position])
+                position += 1
+        return result
+
+    def rewrite(self, text: str) -> str:
+        """Przepisuje tekst (tokeny rozdzielone białymi znakami) i normalizuje odstępy"""
+        return ' '.join(self.rewrite_tokens(text.split()))
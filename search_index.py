@@ -0,0 +1,310 @@
+"""
+Uniwersalny Żołnierz - Struktury indeksowe wyszukiwarki
+Prekomputowane indeksy słownikowe używane przez EcommerceBot
+"""
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Any
+
+from Levenshtein import distance as levenshtein_distance
+
+
+# Normalizacja polskich znaków (ó celowo pozostaje bez zmian)
+POLISH_DIACRITICS = str.maketrans('łćńąęśżź', 'lcnaeszz')
+
+
+def fold_diacritics(text: str) -> str:
+    """Zamienia polskie znaki diakrytyczne na ich odpowiedniki ASCII"""
+    return text.translate(POLISH_DIACRITICS)
+
+
+class BKTree:
+    """Drzewo Burkharda-Kellera nad odległością Levenshteina - szybkie szukanie najbliższego słowa"""
+
+    def __init__(self, words: Iterable[str] = ()):
+        # Węzeł: [słowo, {odległość: węzeł potomny}]
+        self.root = None
+        self.size = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        """Dodaje słowo do drzewa (duplikaty są pomijane)"""
+        if self.root is None:
+            self.root = [word, {}]
+            self.size = 1
+            return
+
+        node = self.root
+        while True:
+            distance = levenshtein_distance(word, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [word, {}]
+                self.size += 1
+                return
+            node = child
+
+    def nearest_distance(self, word: str, max_distance: int) -> Optional[int]:
+        """Zwraca minimalną odległość do słowa w drzewie jeśli <= max_distance, inaczej None"""
+        if self.root is None:
+            return None
+
+        best = None
+        threshold = max_distance
+        stack = [self.root]
+
+        while stack:
+            node_word, children = stack.pop()
+            distance = levenshtein_distance(word, node_word)
+            if distance <= threshold:
+                best = distance
+                if distance == 0:
+                    return 0
+                # Szukamy już tylko lepszych kandydatów
+                threshold = distance - 1
+
+            # Nierówność trójkąta: potomek na krawędzi d może mieć odległość >= |d - distance|
+            for edge, child in children.items():
+                if distance - threshold <= edge <= distance + threshold:
+                    stack.append(child)
+
+        return best
+
+
+class PrefixTrie:
+    """Drzewo prefiksowe - sprawdzenie czy token jest prefiksem znanego słowa w O(len(token))"""
+
+    def __init__(self, words: Iterable[str] = ()):
+        self.root = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        """Dodaje słowo do drzewa"""
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+
+    def has_prefix(self, prefix: str) -> bool:
+        """Czy istnieje słowo zaczynające się od prefix"""
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return False
+        return True
+
+
+class NgramIndex:
+    """Indeks n-gramów znakowych - sprawdzenie czy fraza występuje jako podciąg któregoś z tekstów"""
+
+    def __init__(self, texts: Iterable[str] = (), n: int = 3):
+        self.n = n
+        self.texts = []
+        self.postings = {}
+        # Podciągi krótsze niż n trzymamy wprost - do sprawdzenia samej obecności
+        self.short_substrings = set()
+        self.seen_texts = set()
+        for text in texts:
+            self.add(text)
+
+    def add(self, text: str):
+        """Indeksuje tekst (duplikaty są pomijane)"""
+        if text in self.seen_texts:
+            return
+        self.seen_texts.add(text)
+        text_id = len(self.texts)
+        self.texts.append(text)
+
+        n = self.n
+        for i in range(len(text)):
+            for length in range(1, min(n - 1, len(text) - i) + 1):
+                self.short_substrings.add(text[i:i + length])
+        for i in range(len(text) - n + 1):
+            posting = self.postings.setdefault(text[i:i + n], [])
+            if not posting or posting[-1] != text_id:
+                posting.append(text_id)
+
+    def contains(self, substring: str) -> bool:
+        """Czy substring występuje w którymkolwiek z zaindeksowanych tekstów"""
+        n = self.n
+        if len(substring) < n:
+            return substring == '' or substring in self.short_substrings
+
+        # Najrzadszy n-gram wyznacza kandydatów do weryfikacji
+        shortest = None
+        for i in range(len(substring) - n + 1):
+            posting = self.postings.get(substring[i:i + n])
+            if posting is None:
+                return False
+            if shortest is None or len(posting) < len(shortest):
+                shortest = posting
+
+        if len(substring) == n:
+            return True
+
+        texts = self.texts
+        return any(substring in texts[text_id] for text_id in shortest)
+
+    def find(self, substring: str) -> List[str]:
+        """Teksty zawierające substring (kolejność dodania)"""
+        n = self.n
+        if len(substring) < n:
+            return [text for text in self.texts if substring in text]
+
+        shortest = None
+        for i in range(len(substring) - n + 1):
+            posting = self.postings.get(substring[i:i + n])
+            if posting is None:
+                return []
+            if shortest is None or len(posting) < len(shortest):
+                shortest = posting
+
+        texts = self.texts
+        return [texts[text_id] for text_id in shortest if substring in texts[text_id]]
+
+    def overlapping(self, text: str) -> List[str]:
+        """Teksty mające z text co najmniej jeden wspólny n-gram (kandydaci do porównania fuzzy)"""
+        n = self.n
+        text_ids = set()
+        for i in range(len(text) - n + 1):
+            text_ids.update(self.postings.get(text[i:i + n], ()))
+        return [self.texts[text_id] for text_id in sorted(text_ids)]
+
+
+class FuzzyVocabularyIndex:
+    """Kandydaci do fuzz.ratio ze słownika - filtr długości, wspólnych znaków i bigramów, bez gubienia trafień
+
+    fuzz.ratio = 200 * LCS / (len_a + len_b), więc ratio >= min_ratio wymaga LCS >= L_min.
+    LCS nie przekracza liczby wspólnych znaków (z powtórzeniami), a przy takim LCS słowa dzielą co najmniej
+    (len_a - 1) - 2 * (len_a - L_min) - (len_b - L_min) bigramów (usunięty znak psuje <= 2, wstawiony <= 1).
+    """
+
+    def __init__(self, words: Iterable[str] = (), min_ratio: int = 70):
+        self.min_ratio = min_ratio
+        self.words = []
+        # długość -> {(znak, n-te wystąpienie): id słów}; długość -> {bigram: id słów (powtórzone przy powtórce)}
+        self.char_postings = {}
+        self.bigram_postings = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        """Dodaje słowo do indeksu"""
+        word_id = len(self.words)
+        self.words.append(word)
+        length = len(word)
+
+        char_postings = self.char_postings.setdefault(length, {})
+        for char, count in Counter(word).items():
+            for occurrence in range(1, count + 1):
+                char_postings.setdefault((char, occurrence), array('I')).append(word_id)
+
+        bigram_postings = self.bigram_postings.setdefault(length, {})
+        for i in range(length - 1):
+            bigram_postings.setdefault(word[i:i + 2], array('I')).append(word_id)
+
+    def candidates(self, word: str) -> Iterator[str]:
+        """Słowa, które mogą mieć fuzz.ratio(word, słowo) >= min_ratio (nadzbiór, do weryfikacji)"""
+        word_length = len(word)
+        char_counts = Counter(word)
+        bigrams = {word[i:i + 2] for i in range(word_length - 1)}
+        words = self.words
+
+        for length, char_postings in self.char_postings.items():
+            # Minimalne LCS w arytmetyce całkowitej: 200 * LCS >= min_ratio * (len_a + len_b)
+            min_lcs = -(-self.min_ratio * (word_length + length) // 200)
+            if min(word_length, length) < min_lcs:
+                continue
+
+            common_chars = Counter()
+            for char, count in char_counts.items():
+                for occurrence in range(1, count + 1):
+                    posting = char_postings.get((char, occurrence))
+                    if posting is None:
+                        break
+                    common_chars.update(posting)
+
+            min_common_bigrams = max(
+                (word_length - 1) - 2 * (word_length - min_lcs) - (length - min_lcs),
+                (length - 1) - 2 * (length - min_lcs) - (word_length - min_lcs)
+            )
+            if min_common_bigrams <= 0:
+                for word_id, common in common_chars.items():
+                    if common >= min_lcs:
+                        yield words[word_id]
+                continue
+
+            bigram_postings = self.bigram_postings[length]
+            common_bigrams = Counter()
+            for bigram in bigrams:
+                posting = bigram_postings.get(bigram)
+                if posting is not None:
+                    common_bigrams.update(posting)
+            for word_id, common in common_bigrams.items():
+                if common >= min_common_bigrams and common_chars[word_id] >= min_lcs:
+                    yield words[word_id]
+
+
+class LRUCache:
+    """Ograniczony cache LRU z czasem życia wpisów i licznikami trafień"""
+
+    def __init__(self, maxsize: int = 2048, ttl: Optional[float] = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Zwraca wartość z cache (i odświeża jej pozycję) albo default"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        """Zapisuje wartość, usuwając najdawniej używane wpisy ponad limit"""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Czyści wszystkie wpisy (liczniki zostają)"""
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def stats(self) -> Dict:
+        """Statystyki do monitoringu"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
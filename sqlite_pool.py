@@ -0,0 +1,143 @@
+"""
+Uniwersalny Żołnierz - Pula trwałych połączeń SQLite (WAL)
+Jedno połączenie zapisujące + pula połączeń tylko do odczytu - czytelnicy nie blokują zapisu
+"""
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+# Ustawienia każdego połączenia (journal_mode=WAL jest trwały - zapisany w pliku bazy)
+DEFAULT_PRAGMAS: Tuple[Tuple[str, str], ...] = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),   # w trybie WAL fsync tylko przy checkpoincie - bezpieczne przy awarii procesu
+    ('cache_size', '-8000'),     # 8 MB cache stron na połączenie
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', '5000')
+)
+
+
+class SQLitePool:
+    """Połączenia otwierane raz i używane ponownie (wraz z cache przygotowanych zapytań sqlite3)
+
+    Połączenie jest wypożyczane na czas bloku with, więc pula działa tak samo dla wątków
+    i greenletów eventlet (threading.local dawałby nowe połączenie na każdy request-greenlet).
+    """
+
+    def __init__(self, path: str, readers: int = 4, pragmas: Tuple[Tuple[str, str], ...] = DEFAULT_PRAGMAS,
+                 cached_statements: int = 128, timeout: float = 5.0):
+        self.path = path
+        self.max_readers = max(1, readers)
+        self.pragmas = pragmas
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+
+        self.writer_lock = threading.Lock()
+        self.writer_connection = None
+        self.idle_readers = queue.LifoQueue()
+        self.readers_lock = threading.Lock()
+        self.readers_created = 0
+
+        self.stats_lock = threading.Lock()
+        self.writes = 0
+        self.reads = 0
+        self.reader_waits = 0
+
+    def connect(self, read_only: bool = False) -> sqlite3.Connection:
+        """Nowe połączenie z ustawionymi pragmami"""
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        for name, value in self.pragmas:
+            conn.execute(f'PRAGMA {name}={value}')
+        if read_only:
+            conn.execute('PRAGMA query_only=1')
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Jedyne połączenie zapisujące - transakcja zatwierdzana na końcu bloku (rollback przy wyjątku)"""
+        with self.writer_lock:
+            if self.writer_connection is None:
+                self.writer_connection = self.connect()
+            conn = self.writer_connection
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            with self.stats_lock:
+                self.writes += 1
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Połączenie tylko do odczytu z puli (w WAL nie czeka na zapis i nie blokuje go)"""
+        conn = self.checkout_reader()
+        try:
+            yield conn
+        finally:
+            # Zamknij ewentualną transakcję odczytu - inaczej snapshot WAL trzymałby checkpoint
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle_readers.put(conn)
+            with self.stats_lock:
+                self.reads += 1
+
+    def checkout_reader(self) -> sqlite3.Connection:
+        try:
+            return self.idle_readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.readers_lock:
+            if self.readers_created < self.max_readers:
+                self.readers_created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self.connect(read_only=True)
+            except sqlite3.Error:
+                with self.readers_lock:
+                    self.readers_created -= 1
+                raise
+
+        # Wszystkie połączenia zajęte - czekamy na zwrot
+        with self.stats_lock:
+            self.reader_waits += 1
+        started = time.monotonic()
+        try:
+            return self.idle_readers.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f'No reader connection available after {time.monotonic() - started:.1f}s')
+
+    def close(self):
+        """Zamyka wszystkie połączenia (przy zamykaniu aplikacji)"""
+        with self.writer_lock:
+            if self.writer_connection is not None:
+                self.writer_connection.close()
+                self.writer_connection = None
+        while True:
+            try:
+                self.idle_readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self.readers_lock:
+            self.readers_created = 0
+
+    def stats(self) -> Dict:
+        """Statystyki do monitoringu"""
+        with self.stats_lock:
+            return {
+                'path': self.path,
+                'readers': self.readers_created,
+                'idle_readers': self.idle_readers.qsize(),
+                'max_readers': self.max_readers,
+                'writes': self.writes,
+                'reads': self.reads,
+                'reader_waits': self.reader_waits
+            }
@@ -449,7 +449,8 @@ class EcommerceBotUI {
                 credentials: 'include',
                 body: JSON.stringify({ 
                     query: query,
-                    type: searchType 
+                    type: searchType,
+                    incremental: true
                 })
             });
             
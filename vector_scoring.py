@@ -0,0 +1,108 @@
+"""
+Uniwersalny Żołnierz - Wektorowy silnik scoringu produktów (NumPy)
+Liczy te same wyniki co skalarna pętla w EcommerceBot, ale dla całego katalogu naraz
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy jest opcjonalny - bez niego działa silnik skalarny
+    np = None
+
+
+def numpy_available() -> bool:
+    """Czy silnik wektorowy może zostać użyty"""
+    return np is not None
+
+
+class VectorScoringEngine:
+    """Macierzowy scoring: tokeny produktów jako tablice NumPy, bonusy liczone per unikalna wartość"""
+
+    def __init__(self, product_features: Sequence, vocabulary: Sequence[str],
+                 positions: Optional[Sequence[int]] = None):
+        """positions - podzbiór pozycji katalogu (partycja typu pojazdu); None = cały katalog"""
+        if np is None:
+            raise RuntimeError('NumPy is required for the vector scoring engine')
+
+        if positions is None:
+            self.positions = np.arange(len(product_features), dtype=np.int64)
+        else:
+            self.positions = np.array(positions, dtype=np.int64)
+            product_features = [product_features[position] for position in positions]
+
+        self.vocabulary_ids = {token: i for i, token in enumerate(vocabulary)}
+        self.vocabulary_size = len(vocabulary)
+
+        # Spłaszczone tokeny produktów + offsety (format CSR) do maximum.reduceat
+        flat_token_ids = []
+        offsets = []
+        for features in product_features:
+            offsets.append(len(flat_token_ids))
+            flat_token_ids.extend(self.vocabulary_ids[token] for token in features.tokens)
+        self.flat_token_ids = np.array(flat_token_ids, dtype=np.int32)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.product_count = len(product_features)
+
+        # Unikalne wartości marki/modelu/kategorii - bonusy sprawdzamy raz na wartość
+        self.brands, self.brand_ids = self.intern_values([f.brand_lower for f in product_features])
+        self.models, self.model_ids = self.intern_values([f.model_lower for f in product_features])
+        self.categories, self.category_ids = self.intern_values([f.category_lower for f in product_features])
+
+    @staticmethod
+    def intern_values(values: List[str]):
+        """Zamienia listę stringów na (unikalne wartości, tablica indeksów)"""
+        lookup = {}
+        ids = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            ids[i] = lookup.setdefault(value, len(lookup))
+        return list(lookup), ids
+
+    def token_score_matrix(self, query_tokens: List[str], token_match_scores: Dict[str, Dict[str, float]]):
+        """Macierz (tokeny zapytania x produkty) - najlepsze dopasowanie tokenu w produkcie"""
+        matrix = np.zeros((len(query_tokens), self.product_count), dtype=np.float64)
+        if self.product_count == 0:
+            return matrix
+
+        for row, q_token in enumerate(query_tokens):
+            vocabulary_scores = np.zeros(self.vocabulary_size, dtype=np.float64)
+            for p_token, score in token_match_scores[q_token].items():
+                vocabulary_scores[self.vocabulary_ids[p_token]] = score
+            matrix[row] = np.maximum.reduceat(vocabulary_scores[self.flat_token_ids], self.offsets)
+        return matrix
+
+    def score(self, query: str, query_tokens: List[str],
+              token_match_scores: Dict[str, Dict[str, float]]) -> List[Tuple[int, int]]:
+        """Zwraca (pozycja w katalogu, wynik) w kolejności katalogu dla produktów z wynikiem >= 25"""
+        matrix = self.token_score_matrix(query_tokens, token_match_scores)
+
+        # Średnia - sumujemy wiersz po wierszu jak sum() w pętli skalarnej
+        base_scores = matrix[0].copy()
+        for row in matrix[1:]:
+            base_scores += row
+        base_scores /= len(query_tokens)
+
+        # NAGRODA ZA PRECYZJĘ
+        if len(query_tokens) > 1:
+            min_scores = matrix.min(axis=0)
+            multipliers = np.select(
+                [min_scores > 70, min_scores > 60, min_scores > 50, min_scores < 20],
+                [1.3, 1.2, 1.1, 0.8],
+                default=1.0
+            )
+            base_scores *= multipliers
+
+        # Bonusy kontekstowe - raz na unikalną markę/model/kategorię
+        brand_bonus = np.array(
+            [15 if brand and (brand in query or query in brand) else 0 for brand in self.brands], dtype=np.float64)
+        model_bonus = np.array(
+            [10 if any(len(q) > 2 and q in model for q in query_tokens) else 0 for model in self.models],
+            dtype=np.float64)
+        category_bonus = np.array(
+            [10 if any(q in category for q in query_tokens) else 0 for category in self.categories],
+            dtype=np.float64)
+        bonus = (brand_bonus[self.brand_ids] + model_bonus[self.model_ids]) + category_bonus[self.category_ids]
+
+        final_scores = np.minimum(100, base_scores + bonus)
+
+        rows = np.flatnonzero(final_scores >= 25)
+        return [(int(self.positions[row]), round(float(final_scores[row]))) for row in rows]
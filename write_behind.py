@@ -0,0 +1,222 @@
+"""
+Uniwersalny Żołnierz - Zapis odroczony (write-behind) z grupowym commitem
+Wywołujący dostaje tymczasowe ID od razu, wiersze trafiają do bazy partiami - jeden commit na partię
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlite_pool import SQLitePool
+
+
+class GroupCommitWriter:
+    """Bufor wierszy INSERT zapisywany przez executemany co flush_interval sekund albo co flush_rows wierszy
+
+    flush_interval to okno trwałości: tyle co najwyżej żyje w pamięci zdarzenie, którego ID już zwrócono.
+    flush_interval <= 0 wyłącza bufor (każdy wiersz zapisywany od razu).
+
+    insert_sql przyjmuje ID jako pierwszy parametr - zwrócone ID trafia do kolumny id. ID pochodzą z bloków
+    rezerwowanych w bazie przez reserve_ids(id_block) -> pierwsze ID bloku, więc procesy piszące do tej samej
+    tabeli (workery gunicorna) nie wydają tych samych ID. ID jest tymczasowe: gdy mimo to jest zajęte,
+    wiersz trafia do bazy pod nowym ID nadanym przez bazę (reassigned_ids) zamiast zostać odrzucony.
+    Błąd przejściowy (OperationalError: baza zablokowana, I/O) - partia wraca do bufora, najwyżej
+    max_attempts razy; inny błąd albo wyczerpane próby - zapis wiersz po wierszu, złe wiersze są odrzucane.
+    """
+
+    def __init__(self, pool: SQLitePool, insert_sql: str, reserve_ids: Callable[[int], int],
+                 flush_interval: float = 0.05, flush_rows: int = 200, max_pending: int = 10000,
+                 max_attempts: int = 5, id_block: int = 1000):
+        self.pool = pool
+        self.insert_sql = insert_sql
+        self.reserve_ids = reserve_ids
+        self.id_block = max(1, id_block)
+        self.flush_interval = flush_interval
+        self.flush_rows = max(1, flush_rows)
+        self.max_pending = max(self.flush_rows, max_pending)
+        self.max_attempts = max(1, max_attempts)
+        self.attempts = 0
+
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.worker = None
+        self.id_lock = threading.Lock()
+        self.next_row_id = 1
+        self.last_row_id = 0  # koniec zarezerwowanego bloku (pusty blok - rezerwacja przy pierwszym ID)
+
+        self.rows_written = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.failures = 0
+        self.rejected_rows = 0
+        self.reassigned_ids = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+        # Proces potomny (fork) nie może dzielić bloku ID z rodzicem
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.drop_id_block)
+
+    def start(self):
+        """Uruchamia wątek zapisujący (leniwie - przy pierwszym wierszu)"""
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.stopping.clear()
+                self.worker = threading.Thread(target=self.run, name='group-commit-writer', daemon=True)
+                self.worker.start()
+
+    def allocate_id(self) -> int:
+        """Kolejne ID wiersza z bloku tego procesu (nowy blok rezerwowany w bazie po wyczerpaniu)"""
+        # Osobna blokada - rezerwacja bierze połączenie zapisujące, a flush bierze self.lock wewnątrz niego
+        with self.id_lock:
+            if self.next_row_id > self.last_row_id:
+                self.next_row_id = self.reserve_ids(self.id_block)
+                self.last_row_id = self.next_row_id + self.id_block - 1
+            row_id = self.next_row_id
+            self.next_row_id += 1
+            return row_id
+
+    def drop_id_block(self):
+        """Porzuca zarezerwowany blok ID (kolejne ID z nowego bloku)"""
+        self.id_lock = threading.Lock()
+        self.next_row_id = 1
+        self.last_row_id = 0
+
+    def add(self, row: Sequence) -> int:
+        """Dodaje wiersz do bufora i zwraca jego tymczasowe ID (pod nim wiersz zostanie zapisany w bazie)"""
+        if self.flush_interval <= 0:
+            row_id = self.allocate_id()
+            with self.pool.writer() as conn:
+                try:
+                    conn.execute(self.insert_sql, (row_id, *row))
+                except sqlite3.IntegrityError:
+                    row_id = self.insert_with_new_id(conn, (row_id, *row))
+            return row_id
+
+        if self.worker is None:
+            self.start()
+
+        row_id = self.allocate_id()
+        with self.lock:
+            self.pending.append((row_id, *row))
+            pending_count = len(self.pending)
+
+        if pending_count >= self.max_pending:
+            # Zapis nie nadąża - wywołujący płaci za flush zamiast rosnącego bufora
+            self.flush()
+        elif pending_count >= self.flush_rows:
+            self.wakeup.set()
+        return row_id
+
+    def flush(self) -> int:
+        """Zapisuje bufor jedną transakcją - zwraca liczbę zapisanych wierszy"""
+        with self.flush_lock:
+            with self.lock:
+                rows, self.pending = self.pending, []
+            if not rows:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with self.pool.writer() as conn:
+                    conn.executemany(self.insert_sql, rows)
+                written = len(rows)
+                self.attempts = 0
+            except sqlite3.OperationalError as e:
+                self.attempts += 1
+                with self.lock:
+                    self.failures += 1
+                if self.attempts < self.max_attempts:
+                    # Błąd przejściowy - wiersze wracają na początek bufora, kolejna próba przy następnym flush
+                    with self.lock:
+                        self.pending[:0] = rows
+                    print(f"[DATABASE] 💥 Group commit of {len(rows)} rows failed "
+                          f"(attempt {self.attempts}/{self.max_attempts}): {e}")
+                    return 0
+                print(f"[DATABASE] 💥 Group commit failed {self.attempts} times, writing rows one by one: {e}")
+                written = self.write_rows_individually(rows)
+            except sqlite3.Error as e:
+                # Np. IntegrityError - jeden zły wiersz nie może blokować pozostałych
+                with self.lock:
+                    self.failures += 1
+                print(f"[DATABASE] 💥 Group commit of {len(rows)} rows failed, writing rows one by one: {e}")
+                written = self.write_rows_individually(rows)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            with self.lock:
+                self.rows_written += written
+                self.batches += 1
+                self.max_batch = max(self.max_batch, len(rows))
+                self.last_flush_ms = elapsed_ms
+                self.total_flush_ms += elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            return written
+
+    def write_rows_individually(self, rows: List[Sequence]) -> int:
+        """Zapis wiersz po wierszu w jednej transakcji - wiersze z błędem są odrzucane i liczone"""
+        self.attempts = 0
+        written = 0
+        try:
+            with self.pool.writer() as conn:
+                for row in rows:
+                    try:
+                        try:
+                            conn.execute(self.insert_sql, row)
+                        except sqlite3.IntegrityError:
+                            self.insert_with_new_id(conn, row)
+                        written += 1
+                    except sqlite3.Error as e:
+                        with self.lock:
+                            self.rejected_rows += 1
+                        print(f"[DATABASE] 💥 Rejected row {row[0]}: {e}")
+        except sqlite3.Error as e:
+            written = 0
+            with self.lock:
+                self.rejected_rows += len(rows)
+            print(f"[DATABASE] 💥 Dropped {len(rows)} rows: {e}")
+        return written
+
+    def insert_with_new_id(self, conn: sqlite3.Connection, row: Sequence) -> int:
+        """Ponowny zapis wiersza z ID nadanym przez bazę (tymczasowe ID zajęte) - zwraca nowe ID"""
+        row_id = conn.execute(self.insert_sql, (None, *row[1:])).lastrowid
+        with self.lock:
+            self.reassigned_ids += 1
+        print(f"[DATABASE] ⚠️ Row ID {row[0]} already taken, stored as {row_id}")
+        return row_id
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """Zatrzymuje wątek i zapisuje resztę bufora (przy zamykaniu aplikacji)"""
+        self.stopping.set()
+        self.wakeup.set()
+        if self.worker is not None:
+            self.worker.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict:
+        """Statystyki do monitoringu"""
+        with self.lock:
+            return {
+                'durability_window_ms': round(self.flush_interval * 1000, 1),
+                'pending': len(self.pending),
+                'rows_written': self.rows_written,
+                'batches': self.batches,
+                'avg_batch_size': round(self.rows_written / self.batches, 1) if self.batches else 0.0,
+                'max_batch_size': self.max_batch,
+                'failures': self.failures,
+                'rejected_rows': self.rejected_rows,
+                'reassigned_ids': self.reassigned_ids,
+                'last_flush_ms': round(self.last_flush_ms, 2),
+                'avg_flush_ms': round(self.total_flush_ms / self.batches, 2) if self.batches else 0.0,
+                'max_flush_ms': round(self.max_flush_ms, 2)
+            }
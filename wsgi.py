@@ -2,22 +2,18 @@ import eventlet
 eventlet.monkey_patch()  # MUSI BYĆ JAKO PIERWSZE
 
 from app import app, socketio, bot, DatabaseManager, start_simulator
-from datetime import datetime, timedelta
-import sqlite3
 
 # Initialize on module load
 print("[WSGI] Initializing application...")
 
-bot.initialize_data()
+# Katalog jest już załadowany w EcommerceBot.__init__ - tu tylko obserwacja pliku (CATALOG_WATCH_INTERVAL)
+bot.start_catalog_watcher()
+# Wysyłka GA4 w tle - od razu, żeby zdarzenia z bufora dyskowego poprzedniego procesu wyszły bez czekania na ruch
+bot.ga4_dispatcher.start()
 DatabaseManager.initialize_database()
 
 try:
-    conn = sqlite3.connect('dashboard.db')
-    cursor = conn.cursor()
-    cutoff_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-    cursor.execute('DELETE FROM events WHERE date(timestamp) < ?', (cutoff_date,))
-    conn.commit()
-    conn.close()
+    DatabaseManager.clear_old_events(30)
     print("[WSGI] Database cleaned")
 except Exception as e:
     print(f"[WSGI] Database error: {e}")